@@ -1,8 +1,11 @@
+import functools
+import operator
 import re
+from collections import defaultdict
 
 import pytest
 
-from tinydb.queries import Query, where
+from tinydb.queries import Query, QueryInstance, where, _regex_test
 
 
 def test_no_path():
@@ -44,6 +47,21 @@ def test_callable_in_path_with_map():
     assert not query({'value': 10})
 
 
+def test_callable_in_path_unhashable():
+    class Double:
+        __hash__ = None
+
+        def __call__(self, value):
+            return value + value
+
+    query = Query().value.map(Double()) == 10
+    assert query({'value': 5})
+    assert not query.is_cacheable()
+
+    query = Query().value.map(Double()).map(Double()) == 20
+    assert query({'value': 5})
+
+
 def test_callable_in_path_with_chain():
     rekey = lambda x: {'y': x['a'], 'z': x['b']}
     query = Query().map(rekey).z == 10
@@ -62,6 +80,14 @@ def test_eq():
     assert hash(query)
 
 
+def test_eq_index_hint():
+    query = Query().value.nested == 1
+    assert query._index_hint == ('eq', ('value', 'nested'), 1)
+
+    assert (Query().value != 1)._index_hint is None
+    assert (Query().value.map(str) == '1')._index_hint is None
+
+
 def test_ne():
     query = Query().value != 1
     assert query({'value': 0})
@@ -184,6 +210,31 @@ def test_regex():
     assert not query({'': None})
     assert hash(query)
 
+    # Precompiled patterns work as well
+    query = Query().val.matches(re.compile(r'\d{2}\.'))
+    assert query({'val': '42.'})
+    assert not query({'val': '44'})
+
+    # Repeated values reuse the previous result
+    calls = []
+
+    class Pattern:
+        def match(self, value):
+            calls.append(value)
+            return re.match(r'a', value)
+
+    test = _regex_test(Pattern().match)
+    assert test('abc')
+    assert test('abc')
+    assert not test('xyz')
+    assert not test('xyz')
+    assert test('abc')
+    assert calls == ['abc', 'xyz', 'abc']
+
+    # Invalid patterns are reported when building the query
+    with pytest.raises(re.error):
+        Query().val.matches(r'(')
+
 
 def test_custom():
     def test(value):
@@ -246,6 +297,30 @@ def test_any():
     assert not query({'followers': [{'name': 'greg'}]})
     assert hash(query)
 
+    query = Query().followers.any(['d', 'o', 'n'])
+    assert not query({'followers': 'don'})
+    assert not query({'followers': {'d': 1}})
+
+    query = Query().followers.any(['don', 'jon'])
+    assert query({'followers': [{'name': 'don'}, 'don']})
+    assert not query({'followers': [{'name': 'don'}, 'greg']})
+    assert not query({'followers': []})
+
+
+def test_any_all_nested_query_hash():
+    query = Query().followers.any(Query().name == 'don')
+    assert query == Query().followers.any(Query().name == 'don')
+    assert query != Query().followers.any(Query().name == 'john')
+    assert query != Query().followers.all(Query().name == 'don')
+
+    # Nested queries that aren't cacheable make the whole query uncacheable
+    for method in ('any', 'all'):
+        query = getattr(Query().followers, method)(
+            Query().name.map(str.lower) == 'don'
+        )
+        assert not query.is_cacheable()
+        assert query({'followers': [{'name': 'DON'}]})
+
 
 def test_all():
     query = Query().followers.all(Query().name == 'don')
@@ -272,6 +347,11 @@ def test_all():
     assert not query({'followers': [{'name': 'john'}, {'name': 'bob'}]})
     assert hash(query)
 
+    # Hashable conditions, unhashable values
+    query = Query().followers.all(['don'])
+    assert query({'followers': [['john'], 'don']})
+    assert not query({'followers': [['don']]})
+
 
 def test_has():
     query = Query().key1.key2.exists()
@@ -346,6 +426,25 @@ def test_one_of():
     assert query({'key1': 'value 1'})
     assert query({'key1': 'value 2'})
     assert not query({'key1': 'value 3'})
+    assert not query({'key1': ['value 1']})
+    assert hash(query)
+
+    query = Query().key1.one_of([['value 1'], {'value': 2}])
+    assert query({'key1': ['value 1']})
+    assert query({'key1': {'value': 2}})
+    assert not query({'key1': 'value 1'})
+    assert hash(query)
+
+    query = Query().key1.one_of(v for v in [['value 1'], ['value 2']])
+    assert query({'key1': ['value 1']})
+    assert query({'key1': ['value 2']})
+    assert not query({'key1': ['value 3']})
+    assert hash(query) == hash(Query().key1.one_of([['value 1'],
+                                                    ['value 2']]))
+
+    query = Query().key1.one_of('value 1')
+    assert query({'key1': 'value'})
+    assert not query({'key1': 'value 2'})
 
 
 def test_hash():
@@ -367,6 +466,63 @@ def test_hash():
     assert (Query().key2.exists() | Query().key1.exists()) in d
 
 
+def test_path_hash():
+    assert hash(Query().a.b) == hash(Query()['a']['b'])
+    assert hash(Query().a.b) != hash(Query().b.a)
+    assert Query().a.b._path_hash == Query()['a']['b']._path_hash
+    assert Query().a.b._path_hash != Query().b.a._path_hash
+    assert Query().a.b._path_hash != Query().a._path_hash
+
+
+def test_hash_cached():
+    query = (Query().key1 == 2) & Query().key2.exists()
+    assert query._cached_hash is None
+
+    value = hash(query)
+    assert query._cached_hash == value
+    assert hash(query) == value
+
+
+def test_query_pool():
+    assert (Query().key1 == 2) is (Query().key1 == 2)
+    assert (Query().key1 == 2) is not (Query().key1 == 3)
+    assert (Query().key1 < 2) is not (Query().key1 <= 2)
+
+    # Frozen values don't distinguish between lists and tuples, but
+    # the queries behave differently
+    query_list = Query().key1 == [1, 2]
+    query_tuple = Query().key1 == (1, 2)
+    assert query_list({'key1': [1, 2]})
+    assert not query_tuple({'key1': [1, 2]})
+
+    # Queries with callables in their path are not cacheable and thus
+    # not pooled either
+    def double(x):
+        return x + x
+
+    assert (Query().key1.map(double) == 2) is not \
+        (Query().key1.map(double) == 2)
+
+    # Queries sharing a hash value are equal without comparing it
+    class Uncomparable:
+        def __eq__(self, other):
+            raise AssertionError('compared')
+
+        __hash__ = object.__hash__
+
+    hashval = ('test', Uncomparable())
+    assert QueryInstance(lambda _: True, hashval) == \
+        QueryInstance(lambda _: True, hashval)
+
+
+def test_slots():
+    with pytest.raises(AttributeError):
+        Query().foo = 1
+
+    with pytest.raises(AttributeError):
+        (Query().foo == 1).bar = 1
+
+
 def test_orm_usage():
     data = {'name': 'John', 'age': {'year': 2000}}
 
@@ -407,6 +563,8 @@ def test_noop():
     assert query({'foo': True})
     assert query({'foo': None})
     assert query({})
+    assert query is Query().noop()
+    assert hash(query)
 
 
 def test_equality():
@@ -428,6 +586,7 @@ def test_fragment():
     assert not query({'b': True, 'c': 'yes'})
     assert not query({'a': 5, 'b': True, 'c': 'yes'})
     assert not query({'a': 4, 'b': 'no', 'c': 'yes'})
+    assert not query({'a': None, 'b': True})
 
 
 def test_fragment_with_path():
@@ -436,6 +595,8 @@ def test_fragment_with_path():
     assert query({'doc': {'a': 4, 'b': True, 'c': 'yes'}})
     assert not query({'a': 4, 'b': True, 'c': 'yes'})
     assert not query({'doc': {'a': 4, 'c': 'yes'}})
+    assert not query({'doc': ['a', 'b']})
+    assert not query({'doc': 4})
 
 
 def test_get_item():
@@ -443,3 +604,229 @@ def test_get_item():
 
     assert query({'test': 1})
     assert not query({'test': 0})
+
+
+def test_compiled_clauses():
+    docs = [
+        {},
+        {'a': 1},
+        {'a': 1, 'b': {'c': 2}},
+        {'a': 2, 'b': {'c': 2}},
+        {'a': 1, 'b': 3},
+        {'a': 1, 'b': {'c': 3}},
+    ]
+
+    a = Query().a == 1
+    b = Query().b.c >= 2
+
+    query = a & b
+    assert query._clauses is not None
+    assert [query(doc) for doc in docs] == \
+        [a(doc) and b(doc) for doc in docs]
+
+    query = a | b
+    assert query._clauses is not None
+    assert [query(doc) for doc in docs] == \
+        [a(doc) or b(doc) for doc in docs]
+
+    # Queries of the same shape share the generated code, which is compiled
+    # when the query is first evaluated
+    query = (Query().x == 'y') & (Query().y.z >= 5)
+    code = query._test.__code__
+    assert query({'x': 'y', 'y': {'z': 5}})
+    assert not query({'x': 'y', 'y': {'z': 4}})
+    assert query._test.__code__ is not code
+
+    other = a & b
+    other({})
+    assert query._test.__code__ is other._test.__code__
+
+    # Chains of the same operation are flattened ...
+    query = a & b & (Query().d != 0)
+    assert len(query._clauses[1]) == 3
+    assert query({'a': 1, 'b': {'c': 2}, 'd': 1})
+    assert not query({'a': 1, 'b': {'c': 2}, 'd': 0})
+
+    # ... while mixed operations fall back to regular evaluation
+    query = (a & b) | (Query().d != 0)
+    assert query._clauses is None
+    assert query({'d': 1})
+    assert query({'a': 1, 'b': {'c': 2}})
+    assert not query({'a': 1})
+
+    query = a & Query().b.exists()
+    assert query._clauses is None
+    assert query({'a': 1, 'b': None})
+
+    # Errors during comparisons are not swallowed
+    with pytest.raises(TypeError):
+        (a & b)({'a': 1, 'b': {'c': 'x'}})
+
+    assert hash(a & b) == hash(b & a)
+
+    # Long chains are evaluated without compiling them
+    queries = [where('f{}'.format(i)) == i for i in range(100)]
+    query = functools.reduce(operator.and_, queries)
+    assert query._clauses is None
+    assert query({'f{}'.format(i): i for i in range(100)})
+    assert not query({'f{}'.format(i): 0 for i in range(100)})
+
+
+def test_compiled_clauses_same_results():
+    q = Query()['a'][0] == 1
+    r = where('b') == 2
+    z = where('z') == 0
+
+    docs = [
+        {'a': [1], 'b': 2},
+        defaultdict(int, {'a': {0: 1}, 'b': 2}),
+        {'a': {0: 1}, 'b': 2},
+        {'a': 'x', 'b': 2},
+        {'a': 1},
+        [1],
+    ]
+
+    for doc in docs:
+        expected = q(doc)
+        assert (q & r)(doc) == (expected and r(doc))
+        assert (q | r)(doc) == (expected or r(doc))
+
+        expected = z(doc)
+        assert (z & r)(doc) == (expected and r(doc))
+        assert (r & z)(doc) == (expected and r(doc))
+        assert (z | r)(doc) == (expected or r(doc))
+
+    # Missing keys of a ``defaultdict`` don't match
+    doc = defaultdict(int, {'b': 2})
+    assert not (z & r)(doc)
+    assert not (z | (where('b') == 3))(doc)
+    assert 'z' not in doc
+
+
+def test_cheaper_query_first():
+    calls = []
+
+    def make(name, result, cost):
+        def test(value):
+            calls.append(name)
+            return result
+
+        query = QueryInstance(test, (name,))
+        query._cost = cost
+        return query
+
+    # The cheaper query is evaluated first and short-circuits the other one
+    query = make('expensive', True, 10) & make('cheap', False, 1)
+    assert query._cost == 11
+    assert not query({})
+    assert calls == ['cheap']
+
+    calls.clear()
+    query = make('expensive', False, 10) | make('cheap', True, 1)
+    assert query({})
+    assert calls == ['cheap']
+
+    # Queries with an unknown cost keep their order
+    calls.clear()
+    query = make('unknown', True, None) & make('cheap', False, 1)
+    assert query._cost is None
+    assert not query({})
+    assert calls == ['unknown', 'cheap']
+
+    # Reordering doesn't change the result or the hash
+    query = Query().a.exists() & (Query().b == 1)
+    assert query._cost is not None
+    assert query({'a': 1, 'b': 1})
+    assert not query({'b': 1})
+    assert query == ((Query().b == 1) & Query().a.exists())
+
+    # Queries calling functions in their path may raise and keep their order
+    def boom(value):
+        raise ValueError()
+
+    for query in (Query().map(boom).exists(),
+                  Query().map(boom).one_of([1]),
+                  Query().map(boom).fragment({'a': 1})):
+        assert not ((Query().a == 5) & query)({'a': 1})
+
+
+def test_compiled_path():
+    query = Query().a.b.c == 1
+    assert query({'a': {'b': {'c': 1}}})
+    assert not query({'a': {'b': {'c': 2}}})
+    assert not query({'a': {'b': {}}})
+    assert not query({'a': {'b': [1]}})
+    assert not query({'a': 'b'})
+
+    # Queries with the same path length and operator share their code
+    other = Query().x.y.z == 'foo'
+    assert query._test.__code__ is other._test.__code__
+
+    query = Query().a.b.exists()
+    assert query({'a': {'b': None}})
+    assert not query({'a': {'c': None}})
+    assert not query({'a': None})
+    assert not query({'a': [{'b': None}]})
+    assert query._test.__code__ is Query().x.y.exists()._test.__code__
+
+    with pytest.raises(ValueError):
+        Query().exists()
+
+    # Errors from the comparison itself are not swallowed
+    with pytest.raises(TypeError):
+        (Query().a < 1)({'a': 'x'})
+
+
+def test_shared_subqueries():
+    calls = []
+
+    def test(value):
+        calls.append(value)
+        return value == 1
+
+    a = Query().a.test(test)
+    b = Query().b == 1
+    c = Query().c == 1
+
+    query = (a & b) | (a & c)
+    assert query({'a': 1, 'b': 0, 'c': 1})
+    assert calls == [1]
+
+    calls.clear()
+    assert not query({'a': 0, 'b': 1, 'c': 1})
+    assert calls == [0]
+
+    # Queries without shared subqueries are evaluated as usual
+    calls.clear()
+    query = (a & b) | c
+    assert query({'a': 1, 'b': 0, 'c': 1})
+    assert calls == [1]
+
+
+def test_compiled_clauses_shared_path():
+    query = ((Query().a.b == 1) &
+             (Query().a.c.d == 2) &
+             (Query().a.c.e == 3) &
+             (Query().a.c == {'d': 2, 'e': 3}))
+
+    assert query({'a': {'b': 1, 'c': {'d': 2, 'e': 3}}})
+    assert not query({'a': {'b': 1, 'c': {'d': 2, 'e': 4}}})
+    assert not query({'a': {'b': 1, 'c': {'d': 2}}})
+    assert not query({'a': {'b': 1}})
+    assert not query({'a': 1})
+
+    # Common keys are looked up only once
+    lookups = []
+
+    class Doc(dict):
+        def get(self, key, default=None):
+            lookups.append(key)
+            return super().get(key, default)
+
+    doc = Doc(a=Doc(b=1, c=Doc(d=2, e=3)))
+    assert query(doc)
+    assert lookups == ['a', 'b', 'c', 'd', 'e']
+
+    query = (Query().a.b == 1) | (Query().a.c == 2)
+    assert query({'a': {'c': 2}})
+    assert not query({'a': {'b': 2}})
@@ -5,7 +5,8 @@ import tempfile
 
 import pytest
 
-from tinydb import TinyDB, where
+from tinydb import TinyDB, storages, where
+from tinydb.middlewares import CachingMiddleware
 from tinydb.storages import JSONStorage, MemoryStorage, Storage, touch
 from tinydb.table import Document
 
@@ -97,6 +98,196 @@ def test_json_read(tmpdir):
     db.close()
 
 
+def test_json_fsync(tmpdir, monkeypatch):
+    synced = []
+    monkeypatch.setattr(storages, '_fdatasync', synced.append)
+
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    storage.write(doc)
+    assert len(synced) == 1
+    storage.close()
+
+    synced.clear()
+    storage = JSONStorage(path, fsync=False)
+    storage.write(doc)
+    storage.write(doc)
+    assert synced == []
+
+    storage.sync()
+    assert len(synced) == 1
+    assert storage.read() == doc
+    storage.close()
+
+
+def test_json_unchanged(tmpdir, monkeypatch):
+    synced = []
+    monkeypatch.setattr(storages, '_fdatasync', synced.append)
+
+    path = str(tmpdir.join('test.db'))
+    db = TinyDB(path)
+    db.insert({'a': 1})
+    assert len(synced) == 1
+
+    # Writing the same data again is skipped
+    db.update({'a': 2}, where('a') == 3)
+    db.remove(where('a') == 3)
+    assert len(synced) == 1
+
+    db.update({'a': 2}, where('a') == 1)
+    assert len(synced) == 2
+    assert db.all() == [{'a': 2}]
+    db.close()
+
+
+def test_json_unchanged_external_write(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    db1 = TinyDB(path)
+    db2 = TinyDB(path)
+
+    db1.insert({'a': 1})
+    db2.insert({'a': 2})
+
+    # The data db1 writes equals its last write, but the file has changed
+    db1.remove(doc_ids=[2])
+
+    assert db2.all() == [{'a': 1}]
+    db1.close()
+    db2.close()
+
+
+def test_json_truncate(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.db'))
+    storage = JSONStorage(path)
+    storage.write({'a': {'1': {'value': 'long'}}})
+
+    truncated = []
+    truncate = storage._handle.truncate
+    monkeypatch.setattr(storage._handle, 'truncate',
+                        lambda: truncated.append(True) or truncate())
+
+    # Growing files don't need to be truncated ...
+    storage.write({'a': {'1': {'value': 'longer'}}})
+    assert truncated == []
+
+    # ... but shrinking files do
+    storage.write({'a': {}})
+    assert truncated == [True]
+    assert storage.read() == {'a': {}}
+    storage.close()
+
+    assert tmpdir.join('test.db').read() == '{"a": {}}'
+
+
+def test_json_truncate_after_external_write(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    with TinyDB(path) as db:
+        db.insert({'value': 'short'})
+
+    # The first database has read the short file ...
+    db = TinyDB(path, storage=CachingMiddleware(JSONStorage))
+    assert len(db) == 1
+
+    # ... which is replaced by a longer one
+    with TinyDB(path) as other:
+        other.insert({'value': 'long' * 100})
+
+    # Writing data that is longer than the file the first database has seen
+    # but shorter than the current file
+    db.insert({'value': 'longer'})
+    db.close()
+
+    with open(path) as f:
+        assert json.load(f) == {
+            '_default': {'1': {'value': 'short'}, '2': {'value': 'longer'}}
+        }
+
+
+def test_json_batch(tmpdir, monkeypatch):
+    synced = []
+    monkeypatch.setattr(storages, '_fdatasync', synced.append)
+
+    path = str(tmpdir.join('test.db'))
+    db = TinyDB(path)
+
+    with db.storage.batch():
+        with db.storage.batch():
+            db.insert({'a': 1})
+
+        db.insert({'a': 2})
+
+        # Nothing has been written yet, but reads see the new state
+        assert tmpdir.join('test.db').read() == ''
+        assert db.count(where('a') > 0) == 2
+
+    assert len(synced) == 1
+    db.close()
+
+    db = TinyDB(path)
+    assert db.all() == [{'a': 1}, {'a': 2}]
+    db.close()
+
+
+def test_json_binary(tmpdir):
+    path = str(tmpdir.join('test.db'))
+    db = TinyDB(path, access_mode='rb+', ensure_ascii=False)
+    db.insert({'name': 'Jérôme'})
+    db.insert({'name': 'Zoë'})
+    assert db.get(where('name') == 'Zoë') == {'name': 'Zoë'}
+    db.close()
+
+    assert tmpdir.join('test.db').read_text('utf-8') == (
+        '{"_default": {"1": {"name": "Jérôme"}, "2": {"name": "Zoë"}}}'
+    )
+
+    db = TinyDB(path, access_mode='rb')
+    assert db.all() == [{'name': 'Jérôme'}, {'name': 'Zoë'}]
+    db.close()
+
+
+def test_json_custom_serializer(tmpdir):
+    calls = []
+
+    def dumps(data, **kwargs):
+        calls.append(('dumps', kwargs))
+        return json.dumps(data, **kwargs).encode('utf-8')
+
+    def loads(data):
+        calls.append(('loads', type(data)))
+        return json.loads(data)
+
+    path = str(tmpdir.join('test.db'))
+    for access_mode in ('r+', 'rb+'):
+        calls.clear()
+        storage = JSONStorage(path, access_mode=access_mode,
+                              dumps=dumps, loads=loads, indent=2)
+        storage.write(doc)
+        assert storage.read() == doc
+        storage.close()
+
+        read_type = bytes if 'b' in access_mode else str
+        assert calls == [('dumps', {'indent': 2}), ('loads', read_type)]
+
+
+def test_json_read_returns_fresh_data(tmpdir):
+    path = str(tmpdir.join('test.db'))
+
+    with TinyDB(path) as db:
+        db.insert({'n': {'x': 1}})
+
+        # Modifying nested values of a document doesn't change the data
+        # returned by later reads
+        doc = db.get(doc_id=1)
+        doc['n']['x'] = 999
+        assert db.get(doc_id=1) == {'n': {'x': 1}}
+
+        # ... nor what is written by the next write
+        db.insert({'n': {'x': 2}})
+
+    with TinyDB(path) as db:
+        assert db.get(doc_id=1) == {'n': {'x': 1}}
+
+
 def test_create_dirs():
     temp_dir = tempfile.gettempdir()
 
@@ -121,6 +312,13 @@ def test_create_dirs():
     os.rmdir(db_dir)
 
 
+def test_create_dirs_relative_path(tmpdir, monkeypatch):
+    # A file in the current directory has no parent directory to create
+    monkeypatch.chdir(tmpdir)
+    JSONStorage('db.json', create_dirs=True).close()
+    assert tmpdir.join('db.json').exists()
+
+
 def test_json_invalid_directory():
     with pytest.raises(IOError):
         with TinyDB('/this/is/an/invalid/path/db.json', storage=JSONStorage):
@@ -185,11 +383,24 @@ def test_read_once():
 
         db.insert({'foo': 'bar'})
 
-        assert count == 3  # One for getting the next ID, one for the insert
+        assert count == 2  # Shared by getting the next ID and the insert
 
         db.all()
 
-        assert count == 4
+        assert count == 3
+
+        db.upsert({'foo': 'baz'}, where('foo') == 'baz')
+
+        assert count == 4  # Shared by the update and the insert
+
+        db.get(where('foo') == 'bar')
+
+        assert count == 5
+
+        db.search(where('foo') == 'bar')
+        assert db.contains(where('foo') == 'bar')
+
+        assert count == 6  # contains() uses the cached search results
 
 
 def test_custom_with_exception():
@@ -1,8 +1,11 @@
+import pickle
 import re
 
 import pytest
 
-from tinydb import where
+from tinydb import Query, TinyDB, where
+from tinydb.storages import MemoryStorage
+from tinydb.table import Document
 
 
 def test_next_id(db):
@@ -130,6 +133,9 @@ def test_lru_cache(db):
     assert query not in table._query_cache
 
     table.remove(where('int') == 1)
+    assert len(table._query_cache) == 2
+
+    table.truncate()
     assert not table._query_cache.lru
 
     table.search(query)
@@ -139,6 +145,112 @@ def test_lru_cache(db):
     assert len(table._query_cache) == 0
 
 
+def test_query_cache_mutated_argument(db):
+    table = db.table('table4')
+    table.insert_multiple({'x': i} for i in range(3))
+
+    items = [1]
+    query = where('x').one_of(items)
+
+    # Queries built before and after mutating the list are different
+    items.append(2)
+    assert len(table.search(query)) == 1
+    assert len(table.search(where('x').one_of(items))) == 2
+
+    doc = {'x': 1}
+    query = Query().fragment(doc)
+    doc['x'] = 2
+    assert table.search(query) == [{'x': 1}]
+    assert table.search(Query().fragment(doc)) == [{'x': 2}]
+
+
+def test_query_cache_invalidation():
+    table = TinyDB(storage=MemoryStorage).table('table4')
+    table.insert_multiple({'int': i} for i in range(10))
+
+    one, two, three = where('int') == 1, where('int') == 2, where('int') == 3
+    assert len(table.search(one)) == 1
+    assert len(table.search(two)) == 1
+    assert len(table.search(three)) == 1
+
+    # Inserting a document only affects matching queries
+    table.insert({'int': 1})
+    assert one not in table._query_cache
+    assert two in table._query_cache
+    assert len(table.search(one)) == 2
+
+    # Updating a document affects queries it used to match
+    table.update({'int': 4}, two)
+    assert two not in table._query_cache
+    assert three in table._query_cache
+    assert table.search(two) == []
+
+    # Removing a document affects queries that matched it
+    table.remove(three)
+    assert three not in table._query_cache
+    assert one in table._query_cache
+    assert table.search(three) == []
+
+    # Large writes clear the whole cache
+    table.update({'int': 5})
+    assert len(table._query_cache) == 0
+
+
+def test_query_cache_invalidation_string_ids():
+    table = TinyDB(storage=MemoryStorage).table('table4')
+    table.insert_multiple({'x': i} for i in range(10))
+
+    assert len(table.search(where('x') == 0)) == 1
+    assert len(table.search(where('x') == 1)) == 1
+
+    # Document IDs passed as strings still invalidate the cached results
+    assert table.remove(doc_ids=['1']) == [1]
+    assert table.search(where('x') == 0) == []
+
+    assert table.update({'x': 100}, doc_ids=['2']) == [2]
+    assert table.search(where('x') == 1) == []
+    assert len(table) == 9
+
+
+def test_query_cache_invalidation_json(tmpdir):
+    table = TinyDB(str(tmpdir.join('test.db'))).table('table4')
+    table.insert_multiple({'x': i} for i in range(10))
+
+    query = where('x') == [1, 2]
+    assert table.search(query) == []
+
+    # JSON stores the tuple as a list, so the document matches when read back
+    table.insert({'x': (1, 2)})
+    assert table.search(query) == [{'x': [1, 2]}]
+
+
+def test_query_cache_superset(db):
+    table = db.table('table4')
+    table.insert_multiple({'int': i, 'char': c} for i in range(3) for c in 'ab')
+
+    assert len(table.search(where('int') == 1)) == 2
+
+    # Searching for a narrower query filters the cached results instead of
+    # reading the table
+    table._read_table = lambda: {}
+    query = (where('char') == 'a') & ((where('int') == 1) & (where('int') > 0))
+    assert table.search(query) == [{'int': 1, 'char': 'a'}]
+    assert table.search(where('char') == 'a') == []
+
+
+def test_query_cache_superset_lru_order(db):
+    table = db.table('table4', cache_size=2)
+    table.insert_multiple({'int': i} for i in range(3))
+
+    one, two = where('int') == 1, where('int') == 2
+    table.search(one)
+    table.search(two)
+
+    # Looking for a cached superset doesn't count as using the cached queries
+    table.search(one & (where('int') > 0))
+    assert table._query_cache.lru == [two, one & (where('int') > 0)]
+
+
 def test_table_is_iterable(db):
     table = db.table('table1')
 
@@ -177,3 +289,47 @@ def test_persist_table(db):
 
     db.table("nonpersisted", persist_empty=False)
     assert "nonpersisted" not in db.tables()
+
+
+def test_update_table_document_ids(db):
+    table = db.table('_default')
+
+    # ``_update_table`` passes document IDs converted to the ID class ...
+    def updater(docs):
+        assert sorted(docs) == [1, 2, 3]
+        docs[4] = {'int': 1, 'char': 'd'}
+
+    table._update_table(updater)
+    assert table.get(doc_id=4) == {'int': 1, 'char': 'd'}
+
+    # ... while ``_update_raw_table`` uses the stored string IDs
+    def raw_updater(docs):
+        assert sorted(docs) == ['1', '2', '3', '4']
+        docs.pop('4')
+
+    table._update_raw_table(raw_updater)
+    assert len(table) == 3
+
+
+def test_failed_update_keeps_data(db):
+    with pytest.raises(ValueError):
+        db.insert_multiple([{'int': 2}, 'not a document'])
+
+    assert len(db) == 3
+
+    # Documents that have been updated before the error are unchanged, even
+    # if the storage returns the same data on every read
+    with pytest.raises(KeyError):
+        db.update({'int': 2}, doc_ids=[1, 42])
+
+    assert db.count(where('int') == 2) == 0
+
+
+def test_document_slots():
+    doc = Document({'int': 1}, 3)
+
+    assert not hasattr(doc, '__dict__')
+
+    copied = pickle.loads(pickle.dumps(doc))
+    assert copied == doc
+    assert copied.doc_id == 3
@@ -122,6 +122,20 @@ def test_insert_multiple_with_doc_ids(db: TinyDB):
         db.insert_multiple([Document({'int': 1, 'char': 'a'}, 12)])
 
 
+def test_insert_multiple_with_mixed_doc_ids(db: TinyDB):
+    db.drop_tables()
+
+    assert db.insert({'int': 1}) == 1
+    assert db.insert_multiple([Document({'int': 2}, 3), {'int': 3}]) == [3, 4]
+    assert db.insert({'int': 4}) == 5
+
+    db.drop_tables()
+
+    # The next ID is not known yet when inserting the documents
+    assert db.insert_multiple([Document({'int': 1}, 1), {'int': 2}]) == [1, 2]
+    assert len(db) == 2
+
+
 def test_insert_invalid_type_raises_error(db: TinyDB):
     with pytest.raises(ValueError, match='Document is not a Mapping'):
         # object() as an example of a non-mapping-type
@@ -278,6 +292,18 @@ def test_update_multiple(db: TinyDB):
     assert db.count(where('int') == 4) == 1
 
 
+def test_update_multiple_iterator(db: TinyDB):
+    updates = (
+        ({'int': i}, where('char') == char) for i, char in ((2, 'a'), (4, 'b'))
+    )
+
+    assert db.update_multiple(updates) == [1, 2]
+
+    assert db.count(where('int') == 1) == 1
+    assert db.count(where('int') == 2) == 1
+    assert db.count(where('int') == 4) == 1
+
+
 def test_update_multiple_operation(db: TinyDB):
     def increment(field):
         def transform(el):
@@ -375,6 +401,10 @@ def test_get_multiple_ids(db: TinyDB):
     el = db.all()
     assert db.get(doc_ids=[x.doc_id for x in el]) == el
 
+    # Documents are returned in the order of the IDs, missing and duplicate
+    # IDs are skipped
+    assert db.get(doc_ids=[3, 1, 3, 42]) == [el[2], el[0]]
+
 
 def test_get_invalid(db: TinyDB):
     with pytest.raises(RuntimeError):
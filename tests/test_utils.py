@@ -1,6 +1,6 @@
 import pytest
 
-from tinydb.utils import LRUCache, freeze, FrozenDict
+from tinydb.utils import LRUCache, TinyLFUCache, freeze, FrozenDict
 
 
 def test_lru_cache():
@@ -96,6 +96,88 @@ def test_lru_cache_iteration_works():
     assert count == 0
 
 
+def test_lru_cache_items():
+    cache = LRUCache(capacity=3)
+    cache["a"] = 1
+    cache["b"] = 2
+
+    # Iterating over the items doesn't change the LRU order
+    assert list(cache.items()) == [("a", 1), ("b", 2)]
+    assert cache.lru == ["a", "b"]
+
+
+def test_tiny_lfu_cache():
+    cache = TinyLFUCache(capacity=3)
+    for key in 'abc':
+        cache.get(key)
+        cache[key] = key
+
+    # Frequently used entries ...
+    for _ in range(3):
+        assert cache.get('a') == 'a'
+        assert cache.get('b') == 'b'
+
+    # ... are not replaced by entries used only once
+    for key in 'defg':
+        cache.get(key)
+        cache[key] = key
+
+    assert len(cache) == 3
+    assert 'a' in cache
+    assert 'b' in cache
+    assert 'g' in cache
+
+    # Entries used more often are admitted
+    for _ in range(5):
+        cache.get('x')
+    cache['x'] = 'x'
+    cache.get('y')
+    cache['y'] = 'y'
+
+    assert 'x' in cache
+    assert len(cache) == 3
+
+
+def test_tiny_lfu_cache_operations():
+    cache = TinyLFUCache(capacity=3)
+    cache['a'] = 1
+    cache['a'] = 2
+    cache['b'] = 3
+
+    assert cache['a'] == 2
+    assert cache.get('c') is None
+    assert cache.get('c', 4) == 4
+    assert sorted(cache.lru) == ['a', 'b']
+
+    del cache['a']
+    assert 'a' not in cache
+
+    with pytest.raises(KeyError):
+        del cache['a']
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_tiny_lfu_cache_unlimited():
+    cache = TinyLFUCache()
+    for i in range(100):
+        cache[i] = i
+
+    assert len(cache) == 100
+
+
+def test_tiny_lfu_cache_aging():
+    cache = TinyLFUCache(capacity=2)
+    for _ in range(100):
+        cache.get('a')
+
+    for _ in range(10 * 32):
+        cache.get('b')
+
+    assert cache._frequency('a') < cache._frequency('b')
+
+
 def test_freeze():
     frozen = freeze([0, 1, 2, {'a': [1, 2, 3]}, {1, 2}])
     assert isinstance(frozen, tuple)
@@ -16,16 +16,26 @@ True
 False
 """
 
+import operator
 import re
-from typing import Mapping, Tuple, Callable, Any, Union, List, Optional, Protocol
+import threading
+from collections.abc import Iterator
+from typing import Mapping, Tuple, Callable, Any, Union, List, Optional, \
+    Protocol, Dict, Set
 
-from .utils import freeze
+from .utils import LRUCache, freeze
 
 __all__ = ('Query', 'QueryLike', 'where')
 
+# A sentinel to mark missing values in documents
+_MISSING = object()
+
+# The types that ``any`` and ``all`` treat as a list of values
+_SEQ_TYPES = (list, tuple, set, frozenset)
+
 
 def is_sequence(obj):
-    return hasattr(obj, '__iter__')
+    return isinstance(obj, _SEQ_TYPES)
 
 
 class QueryLike(Protocol):
@@ -69,9 +79,38 @@ class QueryInstance:
     instance can be used as a key in a dictionary.
     """
 
+    __slots__ = ('_test', '_hash', '_cached_hash', '_index_hint', '_clauses',
+                 '_cost', '_operands')
+
     def __init__(self, test: Callable[[Mapping], bool], hashval: Optional[Tuple]):
         self._test = test
         self._hash = hashval
+        self._cached_hash: Optional[int] = None
+
+        # An optional hint describing this query in a way that allows looking
+        # up matching documents in an index instead of scanning the table,
+        # e.g. ``('eq', path, value)`` for equality queries
+        self._index_hint: Optional[Tuple] = None
+
+        # For queries that consist only of simple comparisons: whether they
+        # are combined using ``'and'`` or ``'or'`` and the list of
+        # ``(operator, path, value)`` tuples. This allows compiling them
+        # into a single function (see ``_compile_clauses``).
+        self._clauses: Optional[Tuple[str, Tuple[Tuple, ...]]] = None
+
+        # An estimate of how expensive it is to evaluate this query, used to
+        # evaluate cheaper queries first when combining them. ``None`` means
+        # that the cost is unknown or that the query may raise an exception
+        # (e.g. ``<`` when comparing a string to a number) so it must not be
+        # reordered.
+        self._cost: Optional[int] = None
+
+        # For queries combined using ``&`` or ``|``: the operation and the
+        # two queries that were combined. This allows evaluating subqueries
+        # that occur multiple times only once (see ``_evaluate_shared``).
+        self._operands: Optional[
+            Tuple[str, Tuple['QueryInstance', 'QueryInstance']]
+        ] = None
 
     def is_cacheable(self) -> bool:
         return self._hash is not None
@@ -88,43 +127,584 @@ class QueryInstance:
     def __hash__(self) -> int:
         # We calculate the query hash by using the ``hashval`` object which
         # describes this query uniquely, so we can calculate a stable hash
-        # value by simply hashing it
-        return hash(self._hash)
+        # value by simply hashing it. As the query is used as a key in the
+        # query cache on every search, we only do this once.
+        if self._cached_hash is None:
+            self._cached_hash = hash(self._hash)
+
+        return self._cached_hash
 
     def __repr__(self):
         return 'QueryImpl{}'.format(self._hash)
 
     def __eq__(self, other: object):
         if isinstance(other, QueryInstance):
-            return self._hash == other._hash
+            # Queries built from pooled queries share their hash values, in
+            # which case we can skip comparing them element by element
+            return self._hash is other._hash or self._hash == other._hash
 
         return False
 
     # --- Query modifiers -----------------------------------------------------
 
     def __and__(self, other: 'QueryInstance') -> 'QueryInstance':
-        # We use a frozenset for the hash as the AND operation is commutative
-        # (a & b == b & a) and the frozenset does not consider the order of
-        # elements
-        if self.is_cacheable() and other.is_cacheable():
-            hashval = ('and', frozenset([self._hash, other._hash]))
-        else:
-            hashval = None
-        return QueryInstance(lambda value: self(value) and other(value), hashval)
+        return self._combine('and', other)
 
     def __or__(self, other: 'QueryInstance') -> 'QueryInstance':
-        # We use a frozenset for the hash as the OR operation is commutative
-        # (a | b == b | a) and the frozenset does not consider the order of
-        # elements
+        return self._combine('or', other)
+
+    def __invert__(self) -> 'QueryInstance':
+        hashval = ('not', self._hash) if self.is_cacheable() else None
+
+        # Call the test function directly (see ``_combine``)
+        self_test = self._test
+
+        def test(value):
+            return not self_test(value)
+
+        query = QueryInstance(test, hashval)
+        query._cost = self._cost
+
+        return query
+
+    def _combine(
+            self,
+            operation: str,
+            other: 'QueryInstance'
+    ) -> 'QueryInstance':
+        """
+        Combine this query with another one using ``'and'`` or ``'or'``.
+        """
+        # We use a frozenset for the hash as the AND and OR operations are
+        # commutative (a & b == b & a) and the frozenset does not consider
+        # the order of elements
         if self.is_cacheable() and other.is_cacheable():
-            hashval = ('or', frozenset([self._hash, other._hash]))
+            hashval = (operation, frozenset([self._hash, other._hash]))
         else:
             hashval = None
-        return QueryInstance(lambda value: self(value) or other(value), hashval)
 
-    def __invert__(self) -> 'QueryInstance':
-        hashval = ('not', self._hash) if self.is_cacheable() else None
-        return QueryInstance(lambda value: not self(value), hashval)
+        if self._cost is not None and other._cost is not None:
+            cost: Optional[int] = self._cost + other._cost
+        else:
+            cost = None
+
+        clauses = _combine_clauses(operation, self, other)
+        if clauses is not None:
+            # Evaluate all comparisons in a single function
+            query = QueryInstance(_noop_test, hashval)
+            query._test = _compile_clauses_lazily(query, operation, clauses)
+            query._clauses = (operation, clauses)
+            query._cost = cost
+            query._operands = (operation, (self, other))
+
+            return query
+
+        first, second = self, other
+        if cost is not None and second._cost < first._cost:  # type: ignore
+            # Neither query can raise an exception, so we're free to evaluate
+            # the cheaper one first. If it already decides the result, we
+            # can skip the more expensive one.
+            first, second = second, first
+
+        # Call the test functions directly instead of going through
+        # ``QueryInstance.__call__`` to save a function call
+        first_test = first._test
+        second_test = second._test
+
+        if operation == 'and':
+            def test(value):
+                return first_test(value) and second_test(value)
+
+        else:
+            def test(value):
+                return first_test(value) or second_test(value)
+
+        query = QueryInstance(test, hashval)
+        query._cost = cost
+        query._operands = (operation, (first, second))
+
+        if _has_shared_operands(query):
+            # A subquery occurs multiple times, e.g. ``a`` in
+            # ``(a & b) | (a & c)``. Remember the results of the subqueries
+            # for each evaluated document so each one runs only once.
+            def shared_test(value):
+                return _evaluate_shared(query, value, {})
+
+            query._test = shared_test
+
+        return query
+
+
+# The maximum number of subqueries to inspect when looking for subqueries
+# that occur multiple times. This keeps combining many queries (e.g. using
+# ``functools.reduce``) cheap.
+_SHARED_OPERANDS_LIMIT = 32
+
+
+def _has_shared_operands(query: QueryInstance) -> bool:
+    """
+    Check whether a combined query contains the same subquery multiple times.
+    """
+    seen: Set[Any] = set()
+    stack = [query]
+    remaining = _SHARED_OPERANDS_LIMIT
+
+    while stack and remaining:
+        query = stack.pop()
+
+        if query._operands is not None:
+            stack.extend(query._operands[1])
+            continue
+
+        remaining -= 1
+
+        if query.is_cacheable():
+            if query._hash in seen:
+                return True
+
+            seen.add(query._hash)
+
+    return False
+
+
+def _evaluate_shared(
+        query: QueryInstance,
+        value: Mapping,
+        memo: Dict[Any, Any]
+) -> Any:
+    """
+    Evaluate a combined query, storing the results of its (cacheable)
+    subqueries in ``memo`` so each one is evaluated at most once.
+    """
+    operands = query._operands
+
+    if operands is None:
+        if not query.is_cacheable():
+            return query._test(value)
+
+        result = memo.get(query._hash, _MISSING)
+        if result is _MISSING:
+            result = memo[query._hash] = query._test(value)
+
+        return result
+
+    operation, (first, second) = operands
+
+    if operation == 'and':
+        return (_evaluate_shared(first, value, memo) and
+                _evaluate_shared(second, value, memo))
+    else:
+        return (_evaluate_shared(first, value, memo) or
+                _evaluate_shared(second, value, memo))
+
+
+# The query returned by ``Query.noop()``. As it doesn't depend on anything,
+# we can share a single instance.
+_NOOP = QueryInstance(lambda value: True, ())
+_NOOP._cost = 0
+
+# A pool of recently generated comparison queries. Building the same query
+# multiple times (e.g. ``where('x') == 5`` in a loop) will return the pooled
+# instance. This saves the cost of constructing a new query and makes the
+# query cache hit on identity. The pool maps a query's hash value to a tuple
+# of the query and the value it compares against.
+_query_pool: LRUCache[Tuple, Tuple[QueryInstance, Any]] = \
+    LRUCache(capacity=1024)
+_query_pool_lock = threading.Lock()
+
+
+def _get_pooled_query(hashval: Tuple, rhs: Any) -> Optional[QueryInstance]:
+    try:
+        with _query_pool_lock:
+            pooled = _query_pool.get(hashval)
+    except TypeError:
+        # The value to compare against is not hashable
+        return None
+
+    if pooled is None:
+        return None
+
+    query, pooled_rhs = pooled
+
+    # Query hash values contain frozen values which don't distinguish
+    # between e.g. lists and tuples. But as ``[1] == (1,)`` is ``False``, the
+    # pooled query is only interchangeable if the original values are equal.
+    if pooled_rhs is not rhs and pooled_rhs != rhs:
+        return None
+
+    return query
+
+
+def _pool_query(hashval: Tuple, rhs: Any, query: QueryInstance) -> None:
+    try:
+        with _query_pool_lock:
+            _query_pool[hashval] = (query, rhs)
+    except TypeError:
+        # The value to compare against is not hashable
+        pass
+
+
+# The source code symbols of the operators supported by ``_compile_clauses``
+_OPERATOR_SYMBOLS = {
+    operator.eq: '==',
+    operator.ne: '!=',
+    operator.lt: '<',
+    operator.le: '<=',
+    operator.gt: '>',
+    operator.ge: '>=',
+}
+
+# The maximum number of comparisons to compile into a single function.
+# Longer chains are evaluated using regular functions, as compiling them
+# takes longer than it saves.
+_COMPILED_CLAUSES_LIMIT = 32
+
+# Functions that create compiled clause functions, keyed by the operation
+# (``'and'``/``'or'``) and the operators and path lengths of the clauses
+_clause_compilers: LRUCache[Tuple, Callable[..., Callable[[Mapping], bool]]] \
+    = LRUCache(capacity=256)
+_compilers_lock = threading.Lock()
+
+
+def _get_compiler(
+        compilers: LRUCache,
+        shape: Tuple,
+        build: Callable[[Tuple], Callable]
+) -> Callable:
+    """
+    Get the compiler for ``shape`` from ``compilers``, building and storing
+    it first if necessary.
+    """
+    with _compilers_lock:
+        compiler = compilers.get(shape)
+
+    if compiler is None:
+        compiler = build(shape)
+
+        with _compilers_lock:
+            compilers[shape] = compiler
+
+    return compiler
+
+
+def _combine_clauses(
+        operation: str,
+        left: QueryInstance,
+        right: QueryInstance
+) -> Optional[Tuple[Tuple, ...]]:
+    """
+    Get the clauses of ``left`` and ``right`` combined using ``operation``
+    or ``None`` if they cannot be combined into a single function.
+    """
+    clauses: List[Tuple] = []
+
+    for query in (left, right):
+        if query._clauses is None:
+            return None
+
+        query_operation, query_clauses = query._clauses
+
+        # A single clause can be combined using any operation
+        if query_operation != operation and len(query_clauses) > 1:
+            return None
+
+        clauses.extend(query_clauses)
+
+    if len(clauses) > _COMPILED_CLAUSES_LIMIT:
+        return None
+
+    return tuple(clauses)
+
+
+def _noop_test(value: Mapping) -> bool:
+    return True
+
+
+def _compile_clauses_lazily(
+        query: QueryInstance,
+        operation: str,
+        clauses: Tuple[Tuple, ...]
+) -> Callable[[Mapping], bool]:
+    """
+    Get a test function for ``query`` that compiles its clauses when it's
+    called for the first time.
+
+    This way combining many queries (e.g. using ``functools.reduce``)
+    doesn't compile all the intermediate queries that are never evaluated.
+    """
+    compiled: List[Callable[[Mapping], bool]] = []
+
+    def test(value):
+        if not compiled:
+            compiled.append(_compile_clauses(operation, clauses))
+
+            # Call the compiled function directly from now on
+            query._test = compiled[0]
+
+        return compiled[0](value)
+
+    return test
+
+
+def _regex_test(method: Callable[[str], Any]) -> Callable[[Any], bool]:
+    """
+    Build a test function that runs a compiled regex method (``match`` or
+    ``search``) against string values.
+
+    The result for the most recent value is remembered, as documents often
+    contain the same value over and over again (e.g. categorical fields or
+    sorted data), in which case running the regex again can be skipped.
+    """
+    # Store the value and its result as a single tuple so concurrent
+    # updates can never mix up a value with the result of another one
+    last: List[Tuple[Any, bool]] = [(_MISSING, False)]
+
+    def test(value):
+        if not isinstance(value, str):
+            return False
+
+        last_value, result = last[0]
+        if value is not last_value and value != last_value:
+            result = method(value) is not None
+            last[0] = (value, result)
+
+        return result
+
+    return test
+
+
+def _compile_clauses(
+        operation: str,
+        clauses: Tuple[Tuple, ...]
+) -> Callable[[Mapping], bool]:
+    """
+    Compile a list of ``(operator, path, value)`` clauses combined using
+    ``operation`` into a single function.
+
+    Instead of calling one function per clause and per path element, the
+    generated function resolves all paths and performs all comparisons
+    itself, e.g. ``(where('a') == 1) & (where('b') == 2)`` results in::
+
+        def test(value):
+            try:
+                v = value.get(k0_0, _MISSING)
+                if v is _MISSING:
+                    return False
+            except AttributeError:
+                return False
+            if not v == r0:
+                return False
+            try:
+                v = value.get(k1_0, _MISSING)
+            ...
+            return True
+
+    Paths are resolved in the same way as in :func:`_compile_path`, so
+    combining comparisons doesn't change their results.
+
+    The path elements and values are passed as arguments, so the generated
+    code only depends on the operators and path lengths and can be reused
+    for other queries of the same shape.
+
+    When combining clauses using ``'and'``, paths that start with the same
+    keys as the path of an earlier clause (e.g. ``where('a').b`` and
+    ``where('a').c``) continue from the value resolved by the earlier clause
+    instead of looking up the common keys again. This is safe as a later
+    clause is only reached if all earlier clauses resolved their paths.
+    """
+    clause_shapes = []
+
+    for i, (op, path, _) in enumerate(clauses):
+        # Find the earlier clause that shares the most keys with this one
+        shared = None
+
+        if operation == 'and':
+            best = 0
+            for j in range(i):
+                other_path = clauses[j][1]
+                length = 0
+                for key, other_key in zip(path, other_path):
+                    if key != other_key:
+                        break
+                    length += 1
+
+                if length > best:
+                    best = length
+                    shared = (j, length)
+
+        clause_shapes.append((op, len(path), shared))
+
+    shape = (operation, tuple(clause_shapes))
+
+    compiler = _get_compiler(_clause_compilers, shape, _build_compiler)
+
+    args: List[Any] = []
+    for _, path, rhs in clauses:
+        args.extend(path)
+        args.append(rhs)
+
+    return compiler(*args)
+
+
+def _build_compiler(shape: Tuple) -> Callable[..., Callable[[Mapping], bool]]:
+    operation, clause_shapes = shape
+    params = []
+    lines: List[str] = []
+
+    # The depths at which the resolved values of each clause are reused by
+    # later clauses and thus have to be stored
+    stored: Dict[int, Set[int]] = {}
+    for op, path_length, shared in clause_shapes:
+        if shared is not None:
+            stored.setdefault(shared[0], set()).add(shared[1])
+
+    for i, (op, path_length, shared) in enumerate(clause_shapes):
+        keys = ['k{}_{}'.format(i, j) for j in range(path_length)]
+        rhs = 'r{}'.format(i)
+        params.extend(keys)
+        params.append(rhs)
+
+        # Resolve the path, starting from the value of an earlier clause
+        # that shares the first keys with this one
+        if shared is None:
+            start, depth = 'value', 0
+        else:
+            start, depth = 'v{}_{}'.format(*shared), shared[1]
+
+        if operation == 'and':
+            # A later clause is only reached if all earlier clauses resolved
+            # their paths, so their stored values always exist
+            lines.append('        v = {}'.format(start))
+
+            if depth < path_length:
+                lines.append('        try:')
+                for d in range(depth, path_length):
+                    lines.append('            v = v.get({}, _MISSING)'
+                                 .format(keys[d]))
+                    lines.append('            if v is _MISSING:')
+                    lines.append('                return False')
+
+                    if d + 1 in stored.get(i, ()):
+                        lines.append('            v{}_{} = v'.format(i, d + 1))
+                lines.append('        except AttributeError:')
+                lines.append('            return False')
+
+            # As with regular queries, the comparison itself is performed
+            # outside of the ``try`` block so errors (e.g. comparing a number
+            # with a string) are not swallowed
+            lines.append('        if not v {} {}:'.format(op, rhs))
+            lines.append('            return False')
+
+        else:
+            # Look up the keys one by one until one of them is missing
+            lines.append('        try:')
+            lines.append('            v = {}'.format(start))
+            indent = '            '
+            for d in range(depth, path_length):
+                lines.append(indent + 'v = v.get({}, _MISSING)'
+                             .format(keys[d]))
+                if d + 1 < path_length:
+                    lines.append(indent + 'if v is not _MISSING:')
+                    indent += '    '
+            lines.append('        except AttributeError:')
+            lines.append('            v = _MISSING')
+            lines.append('        if v is not _MISSING and v {} {}:'
+                         .format(op, rhs))
+            lines.append('            return True')
+
+    lines.append('        return {}'.format(operation == 'and'))
+
+    source = '\n'.join(
+        ['def compiler({}):'.format(', '.join(params)),
+         '    def test(value):'] +
+        lines +
+        ['    return test']
+    )
+
+    namespace: Dict[str, Any] = {'_MISSING': _MISSING}
+    exec(compile(source, '<tinydb query>', 'exec'), namespace)
+
+    return namespace['compiler']
+
+
+# Functions that create compiled path resolvers, keyed by the path length
+# and the expression that is evaluated on the resolved value
+_path_compilers: LRUCache[Tuple, Callable[..., Callable[[Any], bool]]] = \
+    LRUCache(capacity=256)
+
+
+def _compile_path(
+        path: Tuple,
+        expression: str,
+        test: Optional[Callable[[Any], bool]] = None,
+        rhs: Any = None
+) -> Callable[[Any], bool]:
+    """
+    Compile a function that resolves a path of keys and then evaluates
+    ``expression`` on the resolved ``value``. The expression may refer to
+    ``test`` and ``rhs``, e.g. ``'test(value)'`` or ``'value == rhs'``.
+
+    The path walk is unrolled, so e.g. ``where('a').b == 1`` results in::
+
+        def runner(value):
+            try:
+                value = value.get(k0, _MISSING)
+                if value is _MISSING:
+                    return False
+                value = value.get(k1, _MISSING)
+                if value is _MISSING:
+                    return False
+            except AttributeError:
+                return False
+
+            return value == rhs
+
+    As with :func:`_compile_clauses`, the generated code only depends on the
+    path length and the expression and is shared between queries.
+    """
+    shape = (len(path), expression)
+
+    compiler = _get_compiler(_path_compilers, shape, _build_path_compiler)
+
+    return compiler(*path, test, rhs)
+
+
+def _build_path_compiler(
+        shape: Tuple
+) -> Callable[..., Callable[[Any], bool]]:
+    path_length, expression = shape
+    keys = ['k{}'.format(i) for i in range(path_length)]
+    lines = []
+
+    if keys:
+        # Looking up keys using a sentinel is much faster than catching a
+        # ``KeyError`` for missing keys and needs only one lookup per key.
+        # Values that aren't mappings don't have a ``get`` method and thus
+        # never match.
+        lines.append('        try:')
+        for key in keys:
+            lines.append('            value = value.get({}, _MISSING)'
+                         .format(key))
+            lines.append('            if value is _MISSING:')
+            lines.append('                return False')
+        lines.append('        except AttributeError:')
+        lines.append('            return False')
+
+    # The test itself is performed outside of the ``try`` block so errors
+    # raised by it are not swallowed
+    lines.append('        return {}'.format(expression))
+
+    source = '\n'.join(
+        ['def compiler({}):'.format(', '.join(keys + ['test', 'rhs'])),
+         '    def runner(value):'] +
+        lines +
+        ['    return runner']
+    )
+
+    namespace: Dict[str, Any] = {'_MISSING': _MISSING}
+    exec(compile(source, '<tinydb query>', 'exec'), namespace)
+
+    return namespace['compiler']
 
 
 class Query(QueryInstance):
@@ -160,10 +740,17 @@ class Query(QueryInstance):
     ``False`` depending on whether the documents match the query or not.
     """
 
+    __slots__ = ('_path', '_path_hash')
+
     def __init__(self) -> None:
         # The current path of fields to access when evaluating the object
         self._path: Tuple[Union[str, Callable], ...] = ()
 
+        # A hash of the path that is updated incrementally when extending the
+        # path. This way we don't have to hash the whole path every time.
+        # It's only kept up to date for cacheable queries.
+        self._path_hash = hash(self._path)
+
         # Prevent empty queries to be evaluated
         def notest(_):
             raise RuntimeError('Empty query was evaluated')
@@ -189,7 +776,16 @@ class Query(QueryInstance):
         query._path = self._path + (item,)
 
         # ... and update the query hash
-        query._hash = ('path', query._path) if self.is_cacheable() else None
+        if self.is_cacheable():
+            query._path_hash = hash((self._path_hash, item))
+            query._hash = ('path', query._path)
+
+            # Derive the hash value from the path hash so hashing long chains
+            # like ``User.address.street.number`` doesn't get slower with every
+            # path element
+            query._cached_hash = hash(('path', query._path_hash))
+        else:
+            query._hash = None
 
         return query
 
@@ -207,7 +803,7 @@ class Query(QueryInstance):
     def _generate_test(
             self,
             test: Callable[[Any], bool],
-            hashval: Tuple,
+            hashval: Optional[Tuple],
             allow_empty_path: bool = False
     ) -> QueryInstance:
         """
@@ -221,25 +817,107 @@ class Query(QueryInstance):
         if not self._path and not allow_empty_path:
             raise ValueError('Query has no path')
 
-        def runner(value):
-            try:
-                # Resolve the path
-                for part in self._path:
-                    if isinstance(part, str):
-                        value = value[part]
-                    else:
-                        value = part(value)
-            except (KeyError, TypeError):
-                return False
-            else:
-                # Perform the specified test
-                return test(value)
+        path = self._path
+
+        if all(isinstance(part, str) for part in path):
+            # Resolve the path using generated code (see ``_compile_path``)
+            runner = _compile_path(path, 'test(value)', test)
+
+        else:
+            def runner(value):
+                try:
+                    # Resolve the path
+                    for part in path:
+                        if isinstance(part, str):
+                            value = value[part]
+                        else:
+                            value = part(value)
+                except (KeyError, TypeError):
+                    return False
+                else:
+                    # Perform the specified test
+                    return test(value)
 
         return QueryInstance(
-            lambda value: runner(value),
+            runner,
             (hashval if self.is_cacheable() else None)
         )
 
+    def _generate_comparison(
+            self,
+            op: Callable[[Any, Any], bool],
+            rhs: Any,
+            hashval: Tuple
+    ) -> QueryInstance:
+        """
+        Generate a query that compares the value at the query path with a
+        given value.
+
+        This works like :meth:`_generate_test` but resolves the query path
+        and performs the comparison in a single function. This saves one
+        function call per evaluated document.
+
+        :param op: The comparison operator (e.g. ``operator.eq``).
+        :param rhs: The value to compare against.
+        :param hashval: The hash of the query.
+        :return: A :class:`~tinydb.queries.QueryInstance` object
+        """
+        if not self._path:
+            raise ValueError('Query has no path')
+
+        cacheable = self.is_cacheable()
+        if cacheable:
+            # Reuse an identical query if we've generated one recently
+            query = _get_pooled_query(hashval, rhs)
+            if query is not None:
+                return query
+
+        path = self._path
+
+        symbol = _OPERATOR_SYMBOLS.get(op)
+        if not all(isinstance(part, str) for part in path):
+            # Only paths of keys can be resolved by generated code
+            symbol = None
+
+        if symbol is not None:
+            # Resolve the path and perform the comparison using generated
+            # code (see ``_compile_path``)
+            runner = _compile_path(path, 'value {} rhs'.format(symbol),
+                                   rhs=rhs)
+
+        else:
+            def runner(value):
+                try:
+                    # Resolve the path
+                    for part in path:
+                        if isinstance(part, str):
+                            value = value[part]
+                        else:
+                            value = part(value)
+                except (KeyError, TypeError):
+                    return False
+                else:
+                    # Perform the comparison
+                    return op(value, rhs)
+
+        if not cacheable:
+            return QueryInstance(runner, None)
+
+        query = QueryInstance(runner, hashval)
+
+        if op is operator.eq or op is operator.ne:
+            # Equality checks never raise, so they can be reordered
+            query._cost = len(path) + 1
+
+        # Allow combining this query with other comparisons into a single
+        # function (see ``QueryInstance.__and__``)
+        if symbol is not None:
+            query._clauses = ('and', ((symbol, path, rhs),))
+
+        _pool_query(hashval, rhs, query)
+
+        return query
+
     def __eq__(self, rhs: Any):
         """
         Test a dict value for equality.
@@ -248,11 +926,18 @@ class Query(QueryInstance):
 
         :param rhs: The value to compare against
         """
-        return self._generate_test(
-            lambda value: value == rhs,
+        query = self._generate_comparison(
+            operator.eq,
+            rhs,
             ('==', self._path, freeze(rhs))
         )
 
+        if query.is_cacheable():
+            # Allow tables to answer this query using an index
+            query._index_hint = ('eq', self._path, rhs)
+
+        return query
+
     def __ne__(self, rhs: Any):
         """
         Test a dict value for inequality.
@@ -261,8 +946,9 @@ class Query(QueryInstance):
 
         :param rhs: The value to compare against
         """
-        return self._generate_test(
-            lambda value: value != rhs,
+        return self._generate_comparison(
+            operator.ne,
+            rhs,
             ('!=', self._path, freeze(rhs))
         )
 
@@ -274,8 +960,9 @@ class Query(QueryInstance):
 
         :param rhs: The value to compare against
         """
-        return self._generate_test(
-            lambda value: value < rhs,
+        return self._generate_comparison(
+            operator.lt,
+            rhs,
             ('<', self._path, rhs)
         )
 
@@ -287,8 +974,9 @@ class Query(QueryInstance):
 
         :param rhs: The value to compare against
         """
-        return self._generate_test(
-            lambda value: value <= rhs,
+        return self._generate_comparison(
+            operator.le,
+            rhs,
             ('<=', self._path, rhs)
         )
 
@@ -300,8 +988,9 @@ class Query(QueryInstance):
 
         :param rhs: The value to compare against
         """
-        return self._generate_test(
-            lambda value: value > rhs,
+        return self._generate_comparison(
+            operator.gt,
+            rhs,
             ('>', self._path, rhs)
         )
 
@@ -313,8 +1002,9 @@ class Query(QueryInstance):
 
         :param rhs: The value to compare against
         """
-        return self._generate_test(
-            lambda value: value >= rhs,
+        return self._generate_comparison(
+            operator.ge,
+            rhs,
             ('>=', self._path, rhs)
         )
 
@@ -324,10 +1014,23 @@ class Query(QueryInstance):
 
         >>> Query().f1.exists()
         """
-        return self._generate_test(
-            lambda _: True,
-            ('exists', self._path)
-        )
+        path = self._path
+
+        if path and all(isinstance(part, str) for part in path):
+            # Only resolve the path without calling a test function
+            hashval = ('exists', path) if self.is_cacheable() else None
+            query = QueryInstance(_compile_path(path, 'True'), hashval)
+            query._cost = len(path)
+
+        else:
+            # Callables in the path may raise, so this query can't be
+            # reordered
+            query = self._generate_test(
+                lambda _: True,
+                ('exists', path)
+            )
+
+        return query
 
     def matches(self, regex: str, flags: int = 0) -> QueryInstance:
         """
@@ -338,11 +1041,9 @@ class Query(QueryInstance):
         :param regex: The regular expression to use for matching
         :param flags: regex flags to pass to ``re.match``
         """
-        def test(value):
-            if not isinstance(value, str):
-                return False
-
-            return re.match(regex, value, flags) is not None
+        # Compile the pattern only once instead of looking it up in the
+        # ``re`` module's cache for every document
+        test = _regex_test(re.compile(regex, flags).match)
 
         return self._generate_test(test, ('matches', self._path, regex))
 
@@ -356,12 +1057,7 @@ class Query(QueryInstance):
         :param regex: The regular expression to use for matching
         :param flags: regex flags to pass to ``re.match``
         """
-
-        def test(value):
-            if not isinstance(value, str):
-                return False
-
-            return re.search(regex, value, flags) is not None
+        test = _regex_test(re.compile(regex, flags).search)
 
         return self._generate_test(test, ('search', self._path, regex))
 
@@ -385,10 +1081,15 @@ class Query(QueryInstance):
                      argument
         :param args: Additional arguments to pass to the test function
         """
-        return self._generate_test(
-            lambda value: func(value, *args),
-            ('test', self._path, func, args)
-        )
+        if args:
+            def test(value):
+                return func(value, *args)
+
+        else:
+            # Without additional arguments we can call the function directly
+            test = func
+
+        return self._generate_test(test, ('test', self._path, func, args))
 
     def any(self, cond: Union[QueryInstance, List[Any]]) -> QueryInstance:
         """
@@ -413,17 +1114,56 @@ class Query(QueryInstance):
                      in the tested document.
         """
         if callable(cond):
+            # Call the test function of nested queries directly and let
+            # ``map`` run the loop in C instead of using a generator
+            cond_test = cond._test if isinstance(cond, QueryInstance) else cond
+
             def test(value):
-                return is_sequence(value) and any(cond(e) for e in value)
+                if not isinstance(value, _SEQ_TYPES):
+                    return False
+
+                return any(map(cond_test, value))
+
+        elif isinstance(cond, _SEQ_TYPES):
+            try:
+                # Use a set so we can check all elements at once
+                cond_set = frozenset(cond)
+            except TypeError:
+                # The list contains unhashable elements
+                cond_set = None
+
+            def test(value):
+                if not isinstance(value, _SEQ_TYPES):
+                    return False
+
+                if cond_set is not None:
+                    try:
+                        return not cond_set.isdisjoint(value)
+                    except TypeError:
+                        # The value contains unhashable elements
+                        pass
+
+                return any(map(cond.__contains__, value))
 
         else:
             def test(value):
-                return is_sequence(value) and any(e in cond for e in value)
+                if not isinstance(value, _SEQ_TYPES):
+                    return False
 
-        return self._generate_test(
-            lambda value: test(value),
-            ('any', self._path, freeze(cond))
-        )
+                return any(e in cond for e in value)
+
+        hashval: Optional[Tuple]
+        if isinstance(cond, QueryInstance):
+            # A nested query already has a hash value describing it. If it's
+            # not cacheable, this query isn't either.
+            hashval = (
+                ('any', self._path, cond._hash)
+                if cond.is_cacheable() else None
+            )
+        else:
+            hashval = ('any', self._path, freeze(cond))
+
+        return self._generate_test(test, hashval)
 
     def all(self, cond: Union['QueryInstance', List[Any]]) -> QueryInstance:
         """
@@ -446,17 +1186,49 @@ class Query(QueryInstance):
                      which has to be contained in the tested document.
         """
         if callable(cond):
+            # Call the test function of nested queries directly and let
+            # ``map`` run the loop in C instead of using a generator
+            cond_test = cond._test if isinstance(cond, QueryInstance) else cond
+
             def test(value):
-                return is_sequence(value) and all(cond(e) for e in value)
+                if not isinstance(value, _SEQ_TYPES):
+                    return False
+
+                return all(map(cond_test, value))
 
         else:
+            try:
+                # Use a set so we can check all elements at once
+                cond_set: Optional[frozenset] = frozenset(cond)
+            except TypeError:
+                # The list contains unhashable elements
+                cond_set = None
+
             def test(value):
-                return is_sequence(value) and all(e in value for e in cond)
+                if not isinstance(value, _SEQ_TYPES):
+                    return False
 
-        return self._generate_test(
-            lambda value: test(value),
-            ('all', self._path, freeze(cond))
-        )
+                if cond_set is not None:
+                    try:
+                        return cond_set.issubset(value)
+                    except TypeError:
+                        # The value contains unhashable elements
+                        pass
+
+                return all(map(value.__contains__, cond))
+
+        hashval: Optional[Tuple]
+        if isinstance(cond, QueryInstance):
+            # A nested query already has a hash value describing it. If it's
+            # not cacheable, this query isn't either.
+            hashval = (
+                ('all', self._path, cond._hash)
+                if cond.is_cacheable() else None
+            )
+        else:
+            hashval = ('all', self._path, freeze(cond))
+
+        return self._generate_test(test, hashval)
 
     def one_of(self, items: List[Any]) -> QueryInstance:
         """
@@ -466,24 +1238,74 @@ class Query(QueryInstance):
 
         :param items: The list of items to check with
         """
-        return self._generate_test(
-            lambda value: value in items,
+        if isinstance(items, Iterator):
+            # Generators can only be consumed once, so we collect the items
+            # first
+            items = list(items)
+
+        # Use a set for constant time membership tests if possible. We only
+        # do this for plain collections as other containers (like strings)
+        # implement the ``in`` operator differently.
+        items_set = None
+        if isinstance(items, _SEQ_TYPES):
+            try:
+                items_set = frozenset(items)
+            except TypeError:
+                # The items aren't hashable
+                pass
+
+        if items_set is None:
+            def test(value):
+                return value in items
+
+        else:
+            def test(value):
+                try:
+                    return value in items_set
+                except TypeError:
+                    # An unhashable value cannot be equal to any of the
+                    # (hashable) items
+                    return False
+
+        query = self._generate_test(
+            test,
             ('one_of', self._path, freeze(items))
         )
+        if items_set is not None and \
+                all(isinstance(part, str) for part in self._path):
+            # Set lookups never raise here, so this query can be reordered
+            # as long as there are no callables in the path
+            query._cost = len(self._path) + 1
+
+        return query
 
     def fragment(self, document: Mapping) -> QueryInstance:
+        # Fetch the items to compare only once
+        items = tuple(document.items())
+
         def test(value):
-            for key in document:
-                if key not in value or value[key] != document[key]:
+            try:
+                get = value.get
+            except AttributeError:
+                # Not a mapping, so it cannot contain the fragment
+                return False
+
+            for key, expected in items:
+                if get(key, _MISSING) != expected:
                     return False
 
             return True
 
-        return self._generate_test(
-            lambda value: test(value),
+        query = self._generate_test(
+            test,
             ('fragment', freeze(document)),
             allow_empty_path=True
         )
+        if all(isinstance(part, str) for part in self._path):
+            # Callables in the path may raise, so only reorder plain paths
+            query._cost = len(self._path) + len(items)
+
+        return query
 
     def noop(self) -> QueryInstance:
         """
@@ -492,10 +1314,7 @@ class Query(QueryInstance):
         Useful for having a base value when composing queries dynamically.
         """
 
-        return QueryInstance(
-            lambda value: True,
-            ()
-        )
+        return _NOOP
 
     def map(self, fn: Callable[[Any], Any]) -> 'Query':
         """
@@ -3,15 +3,25 @@ Contains the :class:`base class <tinydb.storages.Storage>` for storages and
 implementations.
 """
 
+import hashlib
 import io
 import json
 import os
 import warnings
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, Optional, Tuple, Union
 
 __all__ = ('Storage', 'JSONStorage', 'MemoryStorage')
 
+# ``fdatasync`` skips flushing metadata that isn't needed to read the file
+# back (like its modification time). Fall back to ``fsync`` on platforms
+# that don't support it.
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+# Access mode characters that allow writing to a file
+_WRITE_MODE_CHARS = frozenset('+wa')
+
 
 def touch(path: str, create_dirs: bool):
     """
@@ -23,9 +33,10 @@ def touch(path: str, create_dirs: bool):
     if create_dirs:
         base_dir = os.path.dirname(path)
 
-        # Check if we need to create missing parent directories
-        if not os.path.exists(base_dir):
-            os.makedirs(base_dir)
+        # Create missing parent directories. Letting ``makedirs`` handle
+        # existing directories saves checking for them first.
+        if base_dir:
+            os.makedirs(base_dir, exist_ok=True)
 
     # Create the file by opening it in 'a' mode which creates the file if it
     # does not exist yet but does not modify its contents
@@ -81,7 +92,9 @@ class JSONStorage(Storage):
     Store the data in a JSON file.
     """
 
-    def __init__(self, path: str, create_dirs=False, encoding=None, access_mode='r+', **kwargs):
+    def __init__(self, path: str, create_dirs=False, encoding=None, access_mode='r+',
+                 fsync=True, dumps: Callable[..., Union[str, bytes]] = json.dumps,
+                 loads: Callable[[Union[str, bytes]], Any] = json.loads, **kwargs):
         """
         Create a new instance.
 
@@ -94,13 +107,38 @@ class JSONStorage(Storage):
         :param path: Where to store the JSON data.
         :param access_mode: mode in which the file is opened (r, r+)
         :type access_mode: str
+        :param fsync: Whether to force every write to disk using ``fsync``.
+                      Disabling this makes writes much faster but recent
+                      changes may be lost if the system crashes. Use
+                      :meth:`sync` to force them to disk manually.
+        :type fsync: bool
+        :param dumps: The function used to serialize the database state. It is
+                      called with the state and all additional keyword
+                      arguments and may return ``str`` or ``bytes``.
+        :param loads: The function used to deserialize the file contents.
         """
 
         super().__init__()
 
         self._mode = access_mode
+        self._binary = 'b' in access_mode
+        self._fsync = fsync
+        self._dumps = dumps
+        self._loads = loads
         self.kwargs = kwargs
 
+        # The state to write at the end of the current batch (see ``batch``)
+        self._batching = False
+        self._pending: Optional[Dict[str, Dict[str, Any]]] = None
+
+        # The length and digest of the data that was written last (see
+        # ``_digest``) and the size and modification time of the file right
+        # after writing it. If a write would write the exact same data again
+        # (e.g. when an update didn't match any documents) and the file hasn't
+        # been changed since, we can skip it.
+        self._last_digest: Optional[Tuple[int, bytes]] = None
+        self._last_stat: Optional[Tuple[int, int]] = None
+
         if access_mode not in ('r', 'rb', 'r+', 'rb+'):
             warnings.warn(
                 'Using an `access_mode` other than \'r\', \'rb\', \'r+\' '
@@ -109,7 +147,7 @@ class JSONStorage(Storage):
 
         # Create the file if it doesn't exist and creating is allowed by the
         # access mode
-        if any([character in self._mode for character in ('+', 'w', 'a')]):  # any of the writing modes
+        if not _WRITE_MODE_CHARS.isdisjoint(self._mode):
             touch(path, create_dirs=create_dirs)
 
         # Open the file for reading/writing
@@ -118,11 +156,52 @@ class JSONStorage(Storage):
     def close(self) -> None:
         self._handle.close()
 
+    def sync(self) -> None:
+        """
+        Force all written data to disk.
+
+        Only needed when ``fsync`` has been disabled, e.g. to sync once after
+        a series of writes.
+        """
+        self._handle.flush()
+        _fdatasync(self._handle.fileno())
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Combine all writes in a ``with`` block into a single write.
+
+        Inside the block, writes only replace the state to be written (and
+        returned by :meth:`read`). The last state is serialized, written and
+        synced once when the block is left.
+
+        >>> with db.storage.batch():
+        ...     for item in items:
+        ...         db.insert(item)
+        """
+        if self._batching:
+            # Already inside a batch, which will write everything at its end
+            yield
+            return
+
+        self._batching = True
+        try:
+            yield
+        finally:
+            self._batching = False
+
+            data, self._pending = self._pending, None
+            if data is not None:
+                self.write(data)
+
     def read(self) -> Optional[Dict[str, Dict[str, Any]]]:
-        # Get the file size by moving the cursor to the file end and reading
-        # its location
-        self._handle.seek(0, os.SEEK_END)
-        size = self._handle.tell()
+        if self._pending is not None:
+            # Return the state that has not been written yet
+            return self._pending
+
+        # Get the file size from the file system instead of moving the cursor
+        # to the file end and reading its location
+        size = os.fstat(self._handle.fileno()).st_size
 
         if not size:
             # File is empty, so we return ``None`` so TinyDB can properly
@@ -133,28 +212,82 @@ class JSONStorage(Storage):
             self._handle.seek(0)
 
             # Load the JSON contents of the file
-            return json.load(self._handle)
+            return self._loads(self._handle.read())
 
     def write(self, data: Dict[str, Dict[str, Any]]):
+        if self._batching:
+            # Write the data at the end of the batch
+            self._pending = data
+            return
+
+        # Serialize the database state using the user-provided arguments
+        serialized = self._dumps(data, **self.kwargs)
+
+        digest = self._digest(serialized)
+        if digest == self._last_digest and self._stat() == self._last_stat:
+            # The file already contains this data
+            return
+
+        # Forget the last written data in case writing fails midway
+        self._last_digest = None
+
+        # Get the current size of the file. We can't rely on the size we've
+        # seen last, as the file may have been written by someone else since.
+        old_size = os.fstat(self._handle.fileno()).st_size
+
         # Move the cursor to the beginning of the file just in case
         self._handle.seek(0)
 
-        # Serialize the database state using the user-provided arguments
-        serialized = json.dumps(data, **self.kwargs)
+        # Write the serialized data to the file. Binary handles skip the text
+        # layer of the file object, so we encode the data ourselves.
+        if self._binary and isinstance(serialized, str):
+            output: Union[str, bytes] = serialized.encode('utf-8')
+        elif not self._binary and isinstance(serialized, bytes):
+            output = serialized.decode('utf-8')
+        else:
+            output = serialized
 
-        # Write the serialized data to the file
         try:
-            self._handle.write(serialized)
+            self._handle.write(output)
         except io.UnsupportedOperation:
             raise IOError('Cannot write to the database. Access mode is "{0}"'.format(self._mode))
 
+        # Remove data that is behind the new cursor in case the file has
+        # gotten shorter. If the file has grown or kept its size, there's
+        # nothing to remove.
+        if self._handle.tell() < old_size:
+            self._handle.truncate()
+
         # Ensure the file has been written
         self._handle.flush()
-        os.fsync(self._handle.fileno())
+        if self._fsync:
+            _fdatasync(self._handle.fileno())
 
-        # Remove data that is behind the new cursor in case the file has
-        # gotten shorter
-        self._handle.truncate()
+        self._last_digest = digest
+        self._last_stat = self._stat()
+
+    @staticmethod
+    def _digest(serialized: Union[str, bytes]) -> Tuple[int, bytes]:
+        """
+        Get the length and a digest of serialized data.
+
+        Comparing these instead of the data itself means we don't have to
+        keep a copy of the whole serialized database around.
+        """
+
+        if isinstance(serialized, str):
+            serialized = serialized.encode('utf-8')
+
+        return len(serialized), hashlib.blake2b(serialized).digest()
+
+    def _stat(self) -> Tuple[int, int]:
+        """
+        Get the size and modification time of the file.
+        """
+
+        stat = os.fstat(self._handle.fileno())
+
+        return stat.st_size, stat.st_mtime_ns
 
 
 class MemoryStorage(Storage):
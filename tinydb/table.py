@@ -3,7 +3,9 @@ This module implements tables, the central place for accessing and manipulating
 data in TinyDB.
 """
 
+from functools import wraps
 from typing import (
+    Any,
     Callable,
     Dict,
     Iterable,
@@ -17,12 +19,50 @@ from typing import (
 )
 
 from .queries import QueryLike
-from .storages import Storage
+from .storages import MemoryStorage, Storage
 from .utils import LRUCache
 
 __all__ = ('Document', 'Table')
 
 
+def _cached_reads(method: Callable) -> Callable:
+    """
+    Read the storage at most once during a call to a table method, even if
+    the method (or other methods it calls) needs the table data repeatedly.
+
+    The data read is discarded as soon as the outermost call returns, so
+    changes by other database instances are seen by the next call.
+    """
+
+    @wraps(method)
+    def wrapper(self: 'Table', *args: Any, **kwargs: Any) -> Any:
+        self._read_depth += 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._read_depth -= 1
+            if not self._read_depth:
+                self._cached_tables = None
+
+    return wrapper
+
+
+def _make_update(
+    fields: Union[Mapping, Callable[[Mapping], None]]
+) -> Callable[[dict], None]:
+    """
+    Get the function that applies an update to a single document.
+    """
+
+    if callable(fields):
+        # Update documents by calling the update function provided by the
+        # user
+        return fields
+
+    # Update documents by setting all fields from the provided data
+    return lambda doc: doc.update(fields)
+
+
 class Document(dict):
     """
     A document stored in the database.
@@ -31,6 +71,10 @@ class Document(dict):
     its ID using ``doc.doc_id``.
     """
 
+    # Documents are created for every search result, so we avoid the
+    # per-instance ``__dict__``, which takes more memory than most documents
+    __slots__ = ('doc_id',)
+
     def __init__(self, value: Mapping, doc_id: int):
         super().__init__(value)
         self.doc_id = doc_id
@@ -50,8 +94,7 @@ class Table:
         once a threshold is reached.
 
         The query cache is updated on every search operation. When writing
-        data, the whole cache is discarded as the query results may have
-        changed.
+        data, all cached results that may have changed are discarded.
 
     .. admonition:: Customization
 
@@ -108,12 +151,17 @@ class Table:
 
         self._storage = storage
         self._name = name
-        self._query_cache: LRUCache[QueryLike, List[Document]] \
+        self._query_cache: LRUCache[QueryLike, Tuple[Document, ...]] \
             = self.query_cache_class(capacity=cache_size)
 
-        self._next_id = None
+        self._next_id: Optional[int] = None
+
+        # State for ``_cached_reads``
+        self._read_depth = 0
+        self._cached_tables: Optional[Dict[str, Dict[str, Mapping]]] = None
+
         if persist_empty:
-            self._update_table(lambda table: table.clear())
+            self._update_raw_table(lambda table: table.clear())
 
     def __repr__(self):
         args = [
@@ -138,6 +186,7 @@ class Table:
         """
         return self._storage
 
+    @_cached_reads
     def insert(self, document: Mapping) -> int:
         """
         Insert a new document into the table.
@@ -154,30 +203,33 @@ class Table:
         if isinstance(document, self.document_class):
             # For a `Document` object we use the specified ID
             doc_id = document.doc_id
-
-            # We also reset the stored next ID so the next insert won't
-            # re-use document IDs by accident when storing an old value
-            self._next_id = None
         else:
             # In all other cases we use the next free ID
             doc_id = self._get_next_id()
 
         # Now, we update the table and add the document
         def updater(table: dict):
-            if doc_id in table:
-                raise ValueError(f'Document with ID {str(doc_id)} '
-                                 f'already exists')
+            key = str(doc_id)
+            if key in table:
+                raise ValueError(f'Document with ID {key} already exists')
 
             # By calling ``dict(document)`` we convert the data we got to a
             # ``dict`` instance even if it was a different class that
             # implemented the ``Mapping`` interface
-            table[doc_id] = dict(document)
+            table[key] = dict(document)
 
-        # See below for details on ``Table._update``
-        self._update_table(updater)
+            return [doc_id]
+
+        # See below for details on ``Table._update_raw_table``
+        self._update_raw_table(updater)
+
+        # Make sure the next insert won't re-use the document ID by accident
+        # when storing a `Document` object
+        self._reserve_id(doc_id)
 
         return doc_id
 
+    @_cached_reads
     def insert_multiple(self, documents: Iterable[Mapping]) -> List[int]:
         """
         Insert multiple documents into the table.
@@ -188,37 +240,47 @@ class Table:
         doc_ids = []
 
         def updater(table: dict):
+            document_class = self.document_class
+
             for document in documents:
 
                 # Make sure the document implements the ``Mapping`` interface
                 if not isinstance(document, Mapping):
                     raise ValueError('Document is not a Mapping')
 
-                if isinstance(document, self.document_class):
+                if isinstance(document, document_class):
                     # Check if document does not override an existing document
-                    if document.doc_id in table:
+                    doc_id = document.doc_id
+                    if str(doc_id) in table:
                         raise ValueError(
-                            f'Document with ID {str(document.doc_id)} '
+                            f'Document with ID {str(doc_id)} '
                             f'already exists'
                         )
 
                     # Store the doc_id, so we can return all document IDs
                     # later. Then save the document with its doc_id and
                     # skip the rest of the current loop
-                    doc_id = document.doc_id
                     doc_ids.append(doc_id)
-                    table[doc_id] = dict(document)
+                    table[str(doc_id)] = dict(document)
+
+                    # Make sure we don't generate this ID for the following
+                    # documents
+                    self._reserve_id(doc_id)
                     continue
 
                 # Generate new document ID for this document
                 # Store the doc_id, so we can return all document IDs
-                # later, then save the document with the new doc_id
-                doc_id = self._get_next_id()
+                # later, then save the document with the new doc_id.
+                # We pass the table data, as it includes the documents
+                # inserted so far.
+                doc_id = self._get_next_id(table)
                 doc_ids.append(doc_id)
-                table[doc_id] = dict(document)
+                table[str(doc_id)] = dict(document)
+
+            return doc_ids
 
-        # See below for details on ``Table._update``
-        self._update_table(updater)
+        # See below for details on ``Table._update_raw_table``
+        self._update_raw_table(updater)
 
         return doc_ids
 
@@ -248,16 +310,27 @@ class Table:
         # query
         cached_results = self._query_cache.get(cond)
         if cached_results is not None:
-            return cached_results[:]
-
-        # Perform the search by applying the query to all documents.
-        # Then, only if the document matches the query, convert it
-        # to the document class and document ID class.
-        docs = [
-            self.document_class(doc, self.document_id_class(doc_id))
-            for doc_id, doc in self._read_table().items()
-            if cond(doc)
-        ]
+            return list(cached_results)
+
+        # If the results of a broader query are cached (e.g. of ``a`` when
+        # searching for ``a & b``), we only have to filter these results
+        # instead of scanning the whole table
+        superset = self._cached_superset(cond)
+        if superset is not None:
+            docs = [doc for doc in superset if cond(doc)]
+
+        else:
+            # Perform the search by applying the query to all documents.
+            # Then, only if the document matches the query, convert it
+            # to the document class and document ID class. We look up the
+            # classes only once instead of for every matching document.
+            document_class = self.document_class
+            document_id_class = self.document_id_class
+            docs = [
+                document_class(doc, document_id_class(doc_id))
+                for doc_id, doc in self._read_table().items()
+                if cond(doc)
+            ]
 
         # Only cache cacheable queries.
         #
@@ -275,11 +348,48 @@ class Table:
         is_cacheable: Callable[[], bool] = getattr(cond, 'is_cacheable',
                                                    lambda: True)
         if is_cacheable():
-            # Update the query cache
-            self._query_cache[cond] = docs[:]
+            # Update the query cache. We store the results as a tuple, so
+            # they can't be modified and don't need to be copied defensively
+            # when passing them around internally
+            self._query_cache[cond] = tuple(docs)
 
         return docs
 
+    def _cached_superset(
+        self,
+        cond: QueryLike
+    ) -> Optional[Tuple[Document, ...]]:
+        """
+        Find the smallest cached result of a query that ``cond`` combines
+        with other queries using ``&``.
+
+        Every document matching ``cond`` is part of such a result, so it can
+        be searched instead of the whole table.
+        """
+
+        hashval = getattr(cond, '_hash', None)
+        if not isinstance(hashval, tuple) or hashval[:1] != ('and',):
+            return None
+
+        # Collect the hash values of all queries in the AND chain
+        operands = set()
+        pending = [hashval]
+        while pending:
+            hashval = pending.pop()
+            if isinstance(hashval, tuple) and hashval[:1] == ('and',):
+                operands.update(hashval[1])
+                pending.extend(hashval[1])
+
+        superset = None
+        for query, results in self._query_cache.items():
+            if getattr(query, '_hash', None) not in operands:
+                continue
+
+            if superset is None or len(results) < len(superset):
+                superset = results
+
+        return superset
+
     def get(
         self,
         cond: Optional[QueryLike] = None,
@@ -312,19 +422,26 @@ class Table:
             return self.document_class(raw_doc, doc_id)
 
         elif doc_ids is not None:
-            # Filter the table by extracting out all those documents which
-            # have doc id specified in the doc_id list.
-
-            # Since document IDs will be unique, we make it a set to ensure
-            # constant time lookup
-            doc_ids_set = set(str(doc_id) for doc_id in doc_ids)
-
-            # Now return the filtered documents in form of list
-            return [
-                self.document_class(doc, self.document_id_class(doc_id))
-                for doc_id, doc in table.items()
-                if doc_id in doc_ids_set
-            ]
+            # Look up all documents with an ID from the doc_id list instead
+            # of scanning the whole table. Each document is returned only
+            # once and missing documents are skipped.
+            document_class = self.document_class
+            document_id_class = self.document_id_class
+            docs = []
+            seen = set()
+            for doc_id_ in map(str, doc_ids):
+                if doc_id_ in seen:
+                    continue
+                seen.add(doc_id_)
+
+                raw_doc = table.get(doc_id_)
+                if raw_doc is not None:
+                    docs.append(document_class(
+                        raw_doc,
+                        document_id_class(doc_id_)
+                    ))
+
+            return docs
 
         elif cond is not None:
             # Find a document specified by a query
@@ -332,7 +449,7 @@ class Table:
             # doesn't think that `doc_id_` (which is a string) needs
             # to have the same type as `doc_id` which is this function's
             # parameter and is an optional `int`.
-            for doc_id_, doc in self._read_table().items():
+            for doc_id_, doc in table.items():
                 if cond(doc):
                     return self.document_class(
                         doc,
@@ -359,11 +476,18 @@ class Table:
         """
         if doc_id is not None:
             # Documents specified by ID
-            return self.get(doc_id=doc_id) is not None
+            return str(doc_id) in self._read_table()
 
         elif cond is not None:
-            # Document specified by condition
-            return self.get(cond) is not None
+            # Document specified by condition. If the query's results are
+            # cached, we can avoid reading the table at all
+            cached_results = self._query_cache.get(cond)
+            if cached_results is not None:
+                return bool(cached_results)
+
+            # Otherwise stop at the first matching document without
+            # converting it to the document class
+            return any(map(cond, self._read_table().values()))
 
         raise RuntimeError('You have to pass either cond or doc_id')
 
@@ -383,30 +507,30 @@ class Table:
         :returns: a list containing the updated document's ID
         """
 
-        # Define the function that will perform the update
-        if callable(fields):
-            def perform_update(table, doc_id):
-                # Update documents by calling the update function provided by
-                # the user
-                fields(table[doc_id])
-        else:
-            def perform_update(table, doc_id):
-                # Update documents by setting all fields from the provided data
-                table[doc_id].update(fields)
+        # Get the function that will perform the update
+        perform_update = _make_update(fields)
 
         if doc_ids is not None:
             # Perform the update operation for documents specified by a list
             # of document IDs
 
-            updated_ids = list(doc_ids)
+            # Convert the IDs to the document ID class so they match the IDs
+            # of the cached query results
+            updated_ids = list(map(self.document_id_class, doc_ids))
 
             def updater(table: dict):
                 # Call the processing callback with all document IDs
                 for doc_id in updated_ids:
-                    perform_update(table, doc_id)
+                    key = str(doc_id)
+
+                    # Update a copy of the document (see _update_raw_table)
+                    table[key] = doc = dict(table[key])
+                    perform_update(doc)
+
+                return updated_ids
 
-            # Perform the update operation (see _update_table for details)
-            self._update_table(updater)
+            # Perform the update operation (see _update_raw_table for details)
+            self._update_raw_table(updater)
 
             return updated_ids
 
@@ -418,24 +542,26 @@ class Table:
 
             def updater(table: dict):
                 _cond = cast(QueryLike, cond)
+                document_id_class = self.document_id_class
 
-                # We need to convert the keys iterator to a list because
-                # we may remove entries from the ``table`` dict during
-                # iteration and doing this without the list conversion would
-                # result in an exception (RuntimeError: dictionary changed size
-                # during iteration)
-                for doc_id in list(table.keys()):
+                # Updates only modify the documents themselves, so we can
+                # iterate over the table directly
+                for doc_id, doc in table.items():
                     # Pass through all documents to find documents matching the
                     # query. Call the processing callback with the document ID
-                    if _cond(table[doc_id]):
+                    if _cond(doc):
                         # Add ID to list of updated documents
-                        updated_ids.append(doc_id)
+                        updated_ids.append(document_id_class(doc_id))
 
-                        # Perform the update (see above)
-                        perform_update(table, doc_id)
+                        # Perform the update on a copy of the document
+                        # (see above)
+                        table[doc_id] = doc = dict(doc)
+                        perform_update(doc)
 
-            # Perform the update operation (see _update_table for details)
-            self._update_table(updater)
+                return updated_ids
+
+            # Perform the update operation (see _update_raw_table for details)
+            self._update_raw_table(updater)
 
             return updated_ids
 
@@ -445,16 +571,22 @@ class Table:
             updated_ids = []
 
             def updater(table: dict):
+                document_id_class = self.document_id_class
+
                 # Process all documents
-                for doc_id in list(table.keys()):
+                for doc_id, doc in table.items():
                     # Add ID to list of updated documents
-                    updated_ids.append(doc_id)
+                    updated_ids.append(document_id_class(doc_id))
 
-                    # Perform the update (see above)
-                    perform_update(table, doc_id)
+                    # Perform the update on a copy of the document (see
+                    # above)
+                    table[doc_id] = doc = dict(doc)
+                    perform_update(doc)
 
-            # Perform the update operation (see _update_table for details)
-            self._update_table(updater)
+                return updated_ids
+
+            # Perform the update operation (see _update_raw_table for details)
+            self._update_raw_table(updater)
 
             return updated_ids
 
@@ -470,16 +602,13 @@ class Table:
         :returns: a list containing the updated document's ID
         """
 
-        # Define the function that will perform the update
-        def perform_update(fields, table, doc_id):
-            if callable(fields):
-                # Update documents by calling the update function provided
-                # by the user
-                fields(table[doc_id])
-            else:
-                # Update documents by setting all fields from the provided
-                # data
-                table[doc_id].update(fields)
+        # Get the functions that will perform the updates. We do this
+        # once instead of checking the type of ``fields`` for every document
+        # (which also allows passing the updates as an iterator)
+        updaters = [
+            (_make_update(fields), cast(QueryLike, cond))
+            for fields, cond in updates
+        ]
 
         # Perform the update operation for documents specified by a query
 
@@ -487,29 +616,36 @@ class Table:
         updated_ids = []
 
         def updater(table: dict):
-            # We need to convert the keys iterator to a list because
-            # we may remove entries from the ``table`` dict during
-            # iteration and doing this without the list conversion would
-            # result in an exception (RuntimeError: dictionary changed size
-            # during iteration)
-            for doc_id in list(table.keys()):
-                for fields, cond in updates:
-                    _cond = cast(QueryLike, cond)
+            document_id_class = self.document_id_class
 
+            # Updates only modify the documents themselves, so we can
+            # iterate over the table directly
+            for doc_id, doc in table.items():
+                copied = False
+
+                for perform_update, cond in updaters:
                     # Pass through all documents to find documents matching the
-                    # query. Call the processing callback with the document ID
-                    if _cond(table[doc_id]):
+                    # query. Call the processing callback with the document
+                    if cond(doc):
                         # Add ID to list of updated documents
-                        updated_ids.append(doc_id)
+                        updated_ids.append(document_id_class(doc_id))
 
-                        # Perform the update (see above)
-                        perform_update(fields, table, doc_id)
+                        # Perform the update on a copy of the document (see
+                        # _update_raw_table)
+                        if not copied:
+                            table[doc_id] = doc = dict(doc)
+                            copied = True
 
-        # Perform the update operation (see _update_table for details)
-        self._update_table(updater)
+                        perform_update(doc)
+
+            return updated_ids
+
+        # Perform the update operation (see _update_raw_table for details)
+        self._update_raw_table(updater)
 
         return updated_ids
 
+    @_cached_reads
     def upsert(self, document: Mapping, cond: Optional[QueryLike] = None) -> List[int]:
         """
         Update documents, if they exist, insert them otherwise.
@@ -570,15 +706,19 @@ class Table:
             # later.
             # We convert the document ID iterator into a list, so we can both
             # use the document IDs to remove the specified documents and
-            # to return the list of affected document IDs
-            removed_ids = list(doc_ids)
+            # to return the list of affected document IDs. Converting them to
+            # the document ID class makes them match the IDs of the cached
+            # query results.
+            removed_ids = list(map(self.document_id_class, doc_ids))
 
             def updater(table: dict):
                 for doc_id in removed_ids:
-                    table.pop(doc_id)
+                    table.pop(str(doc_id))
+
+                return removed_ids
 
             # Perform the remove operation
-            self._update_table(updater)
+            self._update_raw_table(updater)
 
             return removed_ids
 
@@ -594,21 +734,24 @@ class Table:
                 # the updater function is called
                 _cond = cast(QueryLike, cond)
 
-                # We need to convert the keys iterator to a list because
-                # we may remove entries from the ``table`` dict during
-                # iteration and doing this without the list conversion would
-                # result in an exception (RuntimeError: dictionary changed size
-                # during iteration)
-                for doc_id in list(table.keys()):
-                    if _cond(table[doc_id]):
-                        # Add document ID to list of removed document IDs
-                        removed_ids.append(doc_id)
+                # First collect the matching documents, as we can't remove
+                # entries from the ``table`` dict while iterating over it
+                # (RuntimeError: dictionary changed size during iteration)
+                matching = [
+                    doc_id for doc_id, doc in table.items() if _cond(doc)
+                ]
+
+                # Add the document IDs to list of removed document IDs
+                removed_ids.extend(map(self.document_id_class, matching))
 
-                        # Remove document from the table
-                        table.pop(doc_id)
+                # Remove the documents from the table
+                for doc_id in matching:
+                    del table[doc_id]
+
+                return removed_ids
 
             # Perform the remove operation
-            self._update_table(updater)
+            self._update_raw_table(updater)
 
             return removed_ids
 
@@ -619,8 +762,8 @@ class Table:
         Truncate the table by removing all documents.
         """
 
-        # Update the table by resetting all data
-        self._update_table(lambda table: table.clear())
+        # Replace the table data with an empty table
+        self._overwrite_table({})
 
         # Reset document ID counter
         self._next_id = None
@@ -655,14 +798,19 @@ class Table:
         :returns: an iterator over all documents.
         """
 
+        document_class = self.document_class
+        document_id_class = self.document_id_class
+
         # Iterate all documents and their IDs
         for doc_id, doc in self._read_table().items():
             # Convert documents to the document class
-            yield self.document_class(doc, self.document_id_class(doc_id))
+            yield document_class(doc, document_id_class(doc_id))
 
-    def _get_next_id(self):
+    def _get_next_id(self, table: Optional[Dict[str, Mapping]] = None):
         """
         Return the ID for a newly inserted document.
+
+        :param table: the current table data, if it has been read already
         """
 
         # If we already know the next ID
@@ -676,7 +824,8 @@ class Table:
         # of the current table documents
 
         # Read the table documents
-        table = self._read_table()
+        if table is None:
+            table = self._read_table()
 
         # If the table is empty, set the initial ID
         if not table:
@@ -686,7 +835,7 @@ class Table:
             return next_id
 
         # Determine the next ID based on the maximum ID that's currently in use
-        max_id = max(self.document_id_class(i) for i in table.keys())
+        max_id = max(map(self.document_id_class, table))
         next_id = max_id + 1
 
         # The next ID we will return AFTER this call needs to be larger than
@@ -695,6 +844,17 @@ class Table:
 
         return next_id
 
+    def _reserve_id(self, doc_id: int) -> None:
+        """
+        Make sure the IDs of new documents are larger than a document ID
+        that has been specified explicitly.
+        """
+
+        # If we don't know the next ID yet, it will be determined from the
+        # table data, which includes this document ID
+        if self._next_id is not None and doc_id >= self._next_id:
+            self._next_id = doc_id + 1
+
     def _read_table(self) -> Dict[str, Mapping]:
         """
         Read the table data from the underlying storage.
@@ -705,11 +865,7 @@ class Table:
         """
 
         # Retrieve the tables from the storage
-        tables = self._storage.read()
-
-        if tables is None:
-            # The database is empty
-            return {}
+        tables = self._read_tables()
 
         # Retrieve the current table's data
         try:
@@ -720,25 +876,88 @@ class Table:
 
         return table
 
+    def _read_tables(self) -> Dict[str, Dict[str, Mapping]]:
+        """
+        Read the data of all tables from the underlying storage, reusing the
+        data already read during the current call (see ``_cached_reads``).
+        """
+
+        if self._cached_tables is not None:
+            return self._cached_tables
+
+        tables = self._storage.read()
+
+        if tables is None:
+            # The database is empty
+            tables = {}
+
+        if self._read_depth:
+            self._cached_tables = tables
+
+        return tables
+
     def _update_table(self, updater: Callable[[Dict[int, Mapping]], None]):
         """
         Perform a table update operation.
 
+        The updater is called with the table data, with the document IDs
+        converted to the document ID class. See :meth:`_update_raw_table`
+        for an alternative that avoids converting all document IDs.
+        """
+
+        def raw_updater(raw_table: Dict[str, Mapping]):
+            # Convert the document IDs to the document ID class.
+            # This is required as the rest of TinyDB expects the document IDs
+            # to be an instance of ``self.document_id_class`` but the storage
+            # might convert dict keys to strings.
+            # As we don't know which documents the updater modifies, we
+            # have to pass copies of all of them (see _update_raw_table).
+            table: Dict[int, Mapping] = {
+                self.document_id_class(doc_id): dict(doc)
+                for doc_id, doc in raw_table.items()
+            }
+
+            # Perform the table update operation
+            updater(table)
+
+            # Convert the document IDs back to strings.
+            # This is required as some storages (most notably the JSON file
+            # format) don't support IDs other than strings.
+            raw_table.clear()
+            raw_table.update(
+                (str(doc_id), doc) for doc_id, doc in table.items()
+            )
+
+        self._update_raw_table(raw_updater)
+
+    def _update_raw_table(
+        self,
+        updater: Callable[[Dict[str, Mapping]], Optional[Iterable]]
+    ):
+        """
+        Perform a table update operation on the raw table data.
+
         The storage interface used by TinyDB only allows to read/write the
         complete database data, but not modifying only portions of it. Thus,
         to only update portions of the table data, we first perform a read
         operation, perform the update on the table data and then write
         the updated data back to the storage.
 
+        The updater is called with the table data as stored, i.e. with the
+        document IDs converted to strings. This way we don't have to convert
+        all document IDs back and forth for every update operation, while
+        the updater only converts the IDs it actually touches.
+
         As a further optimization, we don't convert the documents into the
         document class, as the table data will *not* be returned to the user.
-        """
 
-        tables = self._storage.read()
+        The updater may return the IDs of all documents it has inserted,
+        updated or removed. In this case, only the cached query results that
+        may be affected by these documents are discarded instead of the whole
+        query cache.
+        """
 
-        if tables is None:
-            # The database is empty
-            tables = {}
+        tables = self._read_tables()
 
         try:
             raw_table = tables[self.name]
@@ -746,28 +965,83 @@ class Table:
             # The table does not exist yet, so it is empty
             raw_table = {}
 
-        # Convert the document IDs to the document ID class.
-        # This is required as the rest of TinyDB expects the document IDs
-        # to be an instance of ``self.document_id_class`` but the storage
-        # might convert dict keys to strings.
-        table = {
-            self.document_id_class(doc_id): doc
-            for doc_id, doc in raw_table.items()
-        }
-
-        # Perform the table update operation
-        updater(table)
-
-        # Convert the document IDs back to strings.
-        # This is required as some storages (most notably the JSON file format)
-        # don't support IDs other than strings.
-        tables[self.name] = {
-            str(doc_id): doc
-            for doc_id, doc in table.items()
-        }
+        # Perform the update on a copy of the table so the data returned by
+        # the storage isn't modified if the updater fails. Storages may
+        # return the same data on every read, so updaters must not modify
+        # the documents themselves either but replace them with copies.
+        table = dict(raw_table)
+        changed_ids = updater(table)
+
+        tables[self.name] = table
+
+        if changed_ids is None or changed_ids:
+            # The storage may not return the data exactly as we've written
+            # it (e.g. JSON converts tuples to lists), so read it again
+            # the next time
+            self._cached_tables = None
 
         # Write the newly updated data back to the storage
         self._storage.write(tables)
 
+        if changed_ids is None:
+            # Clear the query cache, as the table contents have changed
+            self.clear_cache()
+        elif isinstance(self._storage, MemoryStorage):
+            self._update_query_cache(table, changed_ids)
+        elif changed_ids:
+            # Other storages may not return the documents exactly as we've
+            # written them, so we cannot tell which results are affected
+            self.clear_cache()
+
+    def _overwrite_table(self, table: Dict[str, Mapping]):
+        """
+        Replace the table data as a whole.
+
+        In contrast to :meth:`_update_raw_table`, this doesn't copy the
+        current table data first, which is wasted work if all documents are
+        replaced anyway.
+        """
+
+        tables = self._read_tables()
+        tables[self.name] = table
+
+        # See ``_update_raw_table``
+        self._cached_tables = None
+
+        self._storage.write(tables)
+
         # Clear the query cache, as the table contents have changed
         self.clear_cache()
+
+    def _update_query_cache(self, table: Dict[str, Mapping], doc_ids: Iterable):
+        """
+        Discard cached query results that may have changed after inserting,
+        updating or removing the specified documents.
+
+        A result is still valid if none of the documents was part of it and
+        none of them matches the query now.
+        """
+        doc_ids = set(doc_ids)
+        if not doc_ids:
+            return
+
+        if len(doc_ids) * 2 > len(table):
+            # Checking most of the table against all cached queries would be
+            # more expensive than re-running the queries when needed
+            self.clear_cache()
+            return
+
+        docs = [table.get(str(doc_id)) for doc_id in doc_ids]
+
+        for cond, results in list(self._query_cache.items()):
+            try:
+                stale = (
+                    any(doc.doc_id in doc_ids for doc in results) or
+                    any(doc is not None and cond(doc) for doc in docs)
+                )
+            except Exception:
+                # We cannot tell whether the result has changed
+                stale = True
+
+            if stale:
+                del self._query_cache[cond]
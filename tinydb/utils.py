@@ -4,14 +4,14 @@ Utility functions.
 
 from collections import OrderedDict, abc
 from typing import List, Iterator, TypeVar, Generic, Union, Optional, Type, \
-    TYPE_CHECKING
+    ItemsView, TYPE_CHECKING
 
 K = TypeVar('K')
 V = TypeVar('V')
 D = TypeVar('D')
 T = TypeVar('T')
 
-__all__ = ('LRUCache', 'freeze', 'with_typehint')
+__all__ = ('LRUCache', 'TinyLFUCache', 'freeze', 'with_typehint')
 
 
 def with_typehint(baseclass: Type[T]):
@@ -87,6 +87,11 @@ class LRUCache(abc.MutableMapping, Generic[K, V]):
     def __iter__(self) -> Iterator[K]:
         return iter(self.cache)
 
+    def items(self) -> ItemsView[K, V]:
+        # Iterating over the items doesn't count as accessing them, so don't
+        # use ``__getitem__`` which would change the LRU order
+        return self.cache.items()
+
     def get(self, key: K, default: Optional[D] = None) -> Optional[Union[V, D]]:
         value = self.cache.get(key)
 
@@ -111,6 +116,164 @@ class LRUCache(abc.MutableMapping, Generic[K, V]):
                 self.cache.popitem(last=False)
 
 
+_MASK_64 = 2 ** 64 - 1
+_GOLDEN_RATIO_64 = 0x9E3779B97F4A7C15
+
+
+class TinyLFUCache(abc.MutableMapping, Generic[K, V]):
+    """
+    A cache with a fixed cache size that keeps frequently used entries.
+
+    This class acts as a dictionary like :class:`LRUCache`, but doesn't let
+    rarely used entries replace frequently used ones. New entries are added
+    to a small LRU window. When they're evicted from the window, they only
+    replace the least-recently used entry of the main cache if they have been
+    accessed more often recently. The access frequencies are estimated using
+    a count-min sketch with counters that are halved periodically, so the
+    cache adapts when the usage changes.
+
+    Only lookups using :meth:`get` count as accesses.
+    """
+
+    #: The maximum value of the frequency counters
+    MAX_FREQUENCY = 15
+
+    #: The number of rows (hash functions) of the frequency sketch
+    SKETCH_DEPTH = 4
+
+    def __init__(self, capacity=None) -> None:
+        self.capacity = capacity
+
+        if capacity is None:
+            # Without a size limit, all entries go to the main cache
+            window_capacity = 0
+        else:
+            window_capacity = min(capacity, max(1, capacity // 100))
+
+        self._window_capacity = window_capacity
+        self._window: OrderedDict[K, V] = OrderedDict()
+        self._main: OrderedDict[K, V] = OrderedDict()
+
+        # The frequency sketch (see ``_increment``)
+        width_bits = 4
+        while capacity is not None and 2 ** width_bits < 10 * capacity:
+            width_bits += 1
+
+        width = 2 ** width_bits
+        self._width = width
+        self._shift = 64 - width_bits
+        self._counters = [0] * (width * self.SKETCH_DEPTH)
+        self._sample_size = 10 * width
+        self._accesses = 0
+
+    @property
+    def lru(self) -> List[K]:
+        return list(self)
+
+    @property
+    def length(self) -> int:
+        return len(self._window) + len(self._main)
+
+    def clear(self) -> None:
+        # We keep the access frequencies as they describe which keys are
+        # used frequently, not the cached values
+        self._window.clear()
+        self._main.clear()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._window or key in self._main
+
+    def __setitem__(self, key: K, value: V) -> None:
+        self.set(key, value)
+
+    def __delitem__(self, key: K) -> None:
+        if key in self._window:
+            del self._window[key]
+        else:
+            del self._main[key]
+
+    def __getitem__(self, key) -> V:
+        if key in self._window:
+            return self._window[key]
+
+        return self._main[key]
+
+    def __iter__(self) -> Iterator[K]:
+        yield from self._main
+        yield from self._window
+
+    def get(self, key: K, default: Optional[D] = None) -> Optional[Union[V, D]]:
+        self._increment(key)
+
+        for cache in (self._window, self._main):
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key, last=True)
+
+                return value
+
+        return default
+
+    def set(self, key: K, value: V):
+        for cache in (self._window, self._main):
+            if key in cache:
+                cache[key] = value
+                cache.move_to_end(key, last=True)
+
+                return
+
+        if self.capacity is None:
+            self._main[key] = value
+            return
+
+        # New entries always start in the window
+        self._window[key] = value
+
+        if len(self._window) > self._window_capacity:
+            candidate, candidate_value = self._window.popitem(last=False)
+
+            if len(self._main) < self.capacity - self._window_capacity:
+                self._main[candidate] = candidate_value
+                return
+
+            # The main cache is full: only replace its least-recently used
+            # entry if the candidate is used more often
+            victim = next(iter(self._main), None)
+            if victim is not None and \
+                    self._frequency(candidate) > self._frequency(victim):
+                del self._main[victim]
+                self._main[candidate] = candidate_value
+
+    def _indices(self, key) -> Iterator[int]:
+        # Derive an index for every row using multiplicative hashing. This
+        # uses the high bits of the products, which depend on all bits of
+        # the key's hash value.
+        key_hash = hash(key) & _MASK_64
+
+        for row in range(self.SKETCH_DEPTH):
+            key_hash = (key_hash * _GOLDEN_RATIO_64 + row) & _MASK_64
+            yield row * self._width + (key_hash >> self._shift)
+
+    def _increment(self, key) -> None:
+        counters = self._counters
+        for index in self._indices(key):
+            if counters[index] < self.MAX_FREQUENCY:
+                counters[index] += 1
+
+        # Age all counters regularly, so keys that were used a lot in the
+        # past don't stay in the cache forever
+        self._accesses += 1
+        if self._accesses >= self._sample_size:
+            self._counters = [counter // 2 for counter in counters]
+            self._accesses //= 2
+
+    def _frequency(self, key) -> int:
+        return min(self._counters[index] for index in self._indices(key))
+
+
 class FrozenDict(dict):
     """
     An immutable dictionary.